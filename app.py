@@ -1,31 +1,123 @@
-from flask import Flask, request, jsonify
+import time
+_INICIO = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import joblib
-import os
-from recommender import recomendar_tecnicos
+import threading
+import numpy as np
+from decouple import config
+import recommender
+from control_carga import ADMITIDA, COLA_LLENA, LimitadorConcurrencia
+from pool import PoolTecnicos
+from precomputo import RankingsPrecalculados
+from recommender import obtener_columnas, rankear, registros
+from serializacion import (
+    MIME_JSON, codificar_json, codificar_ranking, decodificar,
+    decodificar_json, formatos_disponibles, normalizar_mime,
+)
+from ubicaciones import almacen_ubicaciones
 
 app = Flask(__name__)
 CORS(app)
 
-# Variables globales para modelo y scaler (carga lazy)
+# Variables globales para modelo y scaler (los mismos objetos que usa recommender.py)
 modelo = None
 scaler = None
 
+# Desglose del arranque en segundos (se expone en /health)
+tiempos_arranque = {"imports": round(time.perf_counter() - _INICIO, 3)}
+listo = False
+
 def cargar_modelo():
-    """Carga el modelo y scaler si existen"""
+    """Carga el modelo y scaler si existen (una sola vez, compartidos con recommender)"""
     global modelo, scaler
     try:
-        if os.path.exists("modelo_recomendacion.pkl") and os.path.exists("scaler.pkl"):
-            modelo = joblib.load("modelo_recomendacion.pkl")
-            scaler = joblib.load("scaler.pkl")
-            print("✅ Modelo y scaler cargados correctamente")
-        else:
-            print("⚠ Modelo o scaler no encontrados. Ejecuta train_model.py primero")
+        recommender.cargar_modelo_recomendacion()
+        modelo, scaler = recommender.model, recommender.scaler
+        print("✅ Modelo y scaler cargados correctamente")
     except Exception as e:
-        print(f"❌ Error al cargar modelo: {e}")
+        print(f"⚠ Modelo o scaler no disponibles. Ejecuta train_model.py primero ({e})")
+
+def iniciar_modelo():
+    """Carga el modelo, ejecuta una predicción de calentamiento y marca el servicio como listo"""
+    global listo
+    t = time.perf_counter()
+    cargar_modelo()
+    tiempos_arranque["carga_modelo"] = round(time.perf_counter() - t, 3)
+    
+    if modelo is not None:
+        t = time.perf_counter()
+        try:
+            recommender.calentar_modelo()
+        except Exception as e:
+            print(f"⚠ Error en el calentamiento del modelo: {e}")
+        tiempos_arranque["calentamiento"] = round(time.perf_counter() - t, 3)
+    
+    tiempos_arranque["total"] = round(time.perf_counter() - _INICIO, 3)
+    listo = True
+    print(f"⏱ Arranque: {tiempos_arranque}")
+
+# Cargar modelo al iniciar la aplicación. Con ML_FAST_START=1 se carga en
+# segundo plano: el servidor acepta conexiones de inmediato y /health
+# responde 503 hasta que el modelo esté cargado y calentado.
+ML_FAST_START = config("ML_FAST_START", default=False, cast=bool)
+if ML_FAST_START:
+    threading.Thread(target=iniciar_modelo, name="carga-modelo", daemon=True).start()
+else:
+    iniciar_modelo()
+
+# Pool de técnicos sincronizado desde Node (ver pool.py)
+pool_tecnicos = PoolTecnicos()
+
+def tecnicos_del_pool():
+    """Técnicos disponibles del pool con las ubicaciones en vivo aplicadas"""
+    version, tecnicos = pool_tecnicos.vista()
+    tecnicos["lat"], tecnicos["lon"] = almacen_ubicaciones.completar(
+        tecnicos["id_tecnico"], tecnicos["lat"], tecnicos["lon"]
+    )
+    return version, tecnicos
 
-# Cargar modelo al iniciar la aplicación
-cargar_modelo()
+# Rankings precalculados de solicitudes abiertas (0 = desactivado, ver precomputo.py)
+PRECOMPUTO_SEG = config("PRECOMPUTO_SEG", default=0, cast=float)
+precalculados = None
+if PRECOMPUTO_SEG > 0:
+    precalculados = RankingsPrecalculados(
+        tecnicos_del_pool, top_k=config("PRECOMPUTO_TOP_K", default=20, cast=int)
+    )
+    precalculados.iniciar(PRECOMPUTO_SEG)
+
+# Volcado periódico de ubicaciones en vivo a tecnico_ubicacion (0 = desactivado)
+UBICACIONES_FLUSH_SEG = config("UBICACIONES_FLUSH_SEG", default=0, cast=float)
+if UBICACIONES_FLUSH_SEG > 0:
+    from db import guardar_ubicaciones
+    almacen_ubicaciones.iniciar_volcado(UBICACIONES_FLUSH_SEG, guardar_ubicaciones)
+
+# Límite de peticiones concurrentes en /recomendar (0 = sin límite, ver control_carga.py)
+CARGA_MAX_CONCURRENTES = config("CARGA_MAX_CONCURRENTES", default=0, cast=int)
+CARGA_DEGRADAR = config("CARGA_DEGRADAR", default=False, cast=bool)
+CARGA_RETRY_AFTER = config("CARGA_RETRY_AFTER", default=1, cast=int)
+# Tiempo máximo para la predicción del modelo en /recomendar (0 = sin límite)
+MODELO_DEADLINE_MS = config("MODELO_DEADLINE_MS", default=0, cast=float)
+limitador = None
+if CARGA_MAX_CONCURRENTES > 0:
+    limitador = LimitadorConcurrencia(
+        CARGA_MAX_CONCURRENTES,
+        max_cola=config("CARGA_MAX_COLA", default=16, cast=int),
+        max_espera=config("CARGA_MAX_ESPERA_MS", default=200, cast=float) / 1000
+    )
+
+def responder(obj, status=200):
+    """Respuesta JSON usando el códec rápido (orjson si está disponible)"""
+    return Response(codificar_json(obj), status=status, mimetype=MIME_JSON)
+
+def negociar_formato_respuesta(mime_entrada):
+    """
+    Elige el formato de respuesta según el header Accept.
+    Sin preferencia explícita se responde en el mismo formato de la petición.
+    """
+    disponibles = formatos_disponibles()
+    candidatos = [mime_entrada] + [m for m in disponibles if m != mime_entrada]
+    return request.accept_mimetypes.best_match(candidatos, default=mime_entrada)
 
 @app.route("/", methods=["GET"])
 def home():
@@ -37,12 +129,52 @@ def home():
         "endpoints": {
             "/": "Información del servicio",
             "/recomendar": "POST - Recomendar técnicos para una solicitud",
+            "/pool": "GET - Versión y tamaño del pool de técnicos",
+            "/pool/tecnicos": "PUT - Reemplazar pool / POST - Aplicar cambios (upserts, eliminar)",
+            "/ubicaciones": "POST - Lote de ubicaciones en vivo / GET - Estado del almacén",
+            "/precomputo": "GET - Estado de los rankings precalculados",
+            "/metricas": "GET - Métricas de control de carga",
             "/health": "GET - Estado de salud del servicio"
         }
     })
 
+def rechazar_por_carga(motivo):
+    """Respuesta rápida cuando el servicio está saturado (429 cola llena / 503 espera agotada)"""
+    status = 429 if motivo == COLA_LLENA else 503
+    respuesta = responder({"error": "Servicio saturado, reintentar", "motivo": motivo}, status)
+    respuesta.headers["Retry-After"] = str(CARGA_RETRY_AFTER)
+    return respuesta
+
 @app.route("/recomendar", methods=["POST"])
 def recomendar():
+    """
+    Endpoint para recomendar técnicos (ver procesar_recomendacion).
+    
+    Con CARGA_MAX_CONCURRENTES > 0 las peticiones pasan por el limitador de
+    concurrencia. Si se rechazan y CARGA_DEGRADAR está activo, se responden
+    con el scorer de respaldo ("degradado": true); si no, 429/503 con Retry-After.
+    
+    Con MODELO_DEADLINE_MS > 0, si el modelo no responde dentro de ese tiempo
+    (contado desde que llegó la petición, incluidos la espera en cola y el
+    armado de features) se usa el scorer de respaldo. La respuesta indica el
+    scorer usado en "scorer" (y en el header X-Scorer).
+    """
+    inicio = time.perf_counter()
+    if limitador is None:
+        return procesar_recomendacion(inicio)
+    
+    motivo = limitador.entrar()
+    if motivo != ADMITIDA:
+        if CARGA_DEGRADAR:
+            return procesar_recomendacion(inicio, degradada=motivo)
+        return rechazar_por_carga(motivo)
+    
+    try:
+        return procesar_recomendacion(inicio)
+    finally:
+        limitador.salir()
+
+def procesar_recomendacion(inicio, degradada=None):
     """
     Endpoint para recomendar técnicos para una solicitud.
     
@@ -79,45 +211,275 @@ def recomendar():
             "tecnicos_recomendados": [...],
             "total": int
         }
+    
+    Modo pool: si el body trae "solicitud" pero no "tecnicos" y el pool ya
+    fue sincronizado, se usan los técnicos disponibles del pool. El header
+    If-Match (ETag de /pool) permite detectar desincronización → 412.
+    Con PRECOMPUTO_SEG > 0 el modo pool devuelve el top-K precalculado si
+    está vigente ("precalculado": true); si no, puntúa en vivo, responde el
+    ranking completo y guarda su top-K.
+    
+    Formatos binarios (ver serializacion.py): con Content-Type
+    application/msgpack o application/vnd.apache.arrow.stream los técnicos
+    llegan como columnas; el header Accept elige el formato de respuesta
+    (por defecto el mismo de la petición). Los errores siempre son JSON.
+    
+    Si el modelo no está cargado se usa el scorer de respaldo
+    ("scorer": "fallback") en lugar de responder 503.
+    
+    Args:
+        inicio: time.perf_counter() al recibir la petición (para el deadline)
+        degradada: Motivo de rechazo del limitador si la petición se atiende
+            por el camino barato (sin modelo); None para el camino normal
     """
     try:
-        data = request.json
+        mime_entrada = normalizar_mime(request.mimetype)
+        if mime_entrada is None:
+            return responder({
+                "error": f"Content-Type no soportado: {request.mimetype}",
+                "soportados": formatos_disponibles()
+            }, 415)
+        
+        try:
+            data = decodificar(request.get_data(), mime_entrada)
+        except ValueError:
+            return responder({"error": "Payload inválido"}, 400)
         
         if not data:
-            return jsonify({"error": "No se recibieron datos"}), 400
+            return responder({"error": "No se recibieron datos"}, 400)
         
         id_solicitud = data.get("id_solicitud")
         
         if not id_solicitud:
-            return jsonify({"error": "id_solicitud requerido"}), 400
+            return responder({"error": "id_solicitud requerido"}, 400)
+        
+        modo_pool = "solicitud" in data and "tecnicos" not in data and pool_tecnicos.sincronizado
+        
+        if degradada:
+            # El modo legacy necesita la BD: no hay camino barato
+            if not modo_pool and not ("solicitud" in data and "tecnicos" in data):
+                return rechazar_por_carga(degradada)
+            limitador.registrar_degradada()
+        
+        # Modelo: no durante la carga inicial ni en modo degradado; con deadline si está configurado
+        con_modelo = listo and modelo is not None and not degradada
+        # Deadline absoluto (perf_counter): rankear descuenta también el armado de features
+        deadline = None
+        if con_modelo and MODELO_DEADLINE_MS > 0:
+            deadline = inicio + MODELO_DEADLINE_MS / 1000
+        
+        # Modo pool: Node solo envía la solicitud
+        pool_version = None
+        precalculado = False
+        columnas = None
+        scorer = "fallback"
+        if modo_pool:
+            pool_version = pool_tecnicos.version
+            if_match = request.headers.get("If-Match")
+            if if_match and if_match != pool_tecnicos.etag_de(pool_version):
+                return responder({
+                    "error": "Pool desincronizado",
+                    "etag": pool_tecnicos.etag_de(pool_version)
+                }, 412)
+            
+            if precalculados is not None:
+                columnas = precalculados.obtener(id_solicitud, data["solicitud"])
+                precalculado = columnas is not None
+                if precalculado:
+                    scorer = "modelo"
+            
+            if columnas is None:
+                generacion = precalculados.generacion() if precalculados is not None else None
+                pool_version, tecnicos = tecnicos_del_pool()
+                data = dict(data, tecnicos=tecnicos)
+                columnas = obtener_columnas(id_solicitud, data)
+                if columnas is not None:
+                    columnas, scorer = rankear(columnas, columnar=True, con_modelo=con_modelo, deadline=deadline)
+                # Se guarda el top-K pero se responde el ranking completo. Solo se
+                # guardan rankings del modelo (los de respaldo no son los definitivos)
+                if precalculados is not None and scorer == "modelo":
+                    precalculados.guardar(id_solicitud, data["solicitud"], columnas or {}, generacion)
+        else:
+            # 🔥 NUEVO: pasar el payload completo a recommender
+            columnas = obtener_columnas(id_solicitud, data)
+            if columnas is not None:
+                columnas, scorer = rankear(columnas, columnar=True, con_modelo=con_modelo, deadline=deadline)
+        
+        if columnas is None:
+            columnas = {}
         
-        if modelo is None or scaler is None:
-            return jsonify({
-                "error": "Modelo no disponible. Ejecuta train_model.py primero",
-                "message": "El modelo de machine learning no está cargado. Por favor, entrena el modelo primero."
-            }), 503
+        # Campos adicionales, iguales en JSON y en los formatos binarios
+        extras = {}
+        if pool_version is not None:
+            extras["pool_version"] = pool_version
+            extras["precalculado"] = precalculado
+        if degradada:
+            extras["degradado"] = True
+        extras["scorer"] = scorer
         
-        # 🔥 NUEVO: pasar el payload completo a recommender
-        resultados = recomendar_tecnicos(id_solicitud, payload=data)
+        mime_salida = negociar_formato_respuesta(mime_entrada)
+        if mime_salida != MIME_JSON:
+            respuesta = Response(
+                codificar_ranking(id_solicitud, columnas, mime_salida, extras), mimetype=mime_salida
+            )
+        else:
+            resultados = registros(columnas)
+            cuerpo = {
+                "id_solicitud": id_solicitud,
+                "tecnicos_recomendados": resultados,
+                "total": len(resultados),
+                **extras
+            }
+            respuesta = responder(cuerpo)
         
-        return jsonify({
-            "id_solicitud": id_solicitud,
-            "tecnicos_recomendados": resultados,
-            "total": len(resultados)
-        })
+        respuesta.headers["X-Scorer"] = scorer
+        if pool_version is not None:
+            respuesta.headers["ETag"] = pool_tecnicos.etag_de(pool_version)
+        return respuesta
     
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return responder({"error": str(e)}, 500)
+
+def responder_pool():
+    """Estado del pool con su ETag en el header"""
+    estado = pool_tecnicos.estado()
+    respuesta = responder(estado)
+    respuesta.headers["ETag"] = estado["etag"]
+    return respuesta
+
+@app.route("/pool", methods=["GET"])
+def pool_estado():
+    """Versión, ETag y tamaño del pool de técnicos"""
+    return responder_pool()
+
+@app.route("/pool/tecnicos", methods=["PUT", "POST"])
+def pool_sincronizar():
+    """
+    Sincroniza el pool de técnicos desde Node.
+    
+    PUT  (reemplazo completo):  { "tecnicos": [ {...}, ... ] }
+    POST (delta):               { "upserts": [ {...}, ... ], "eliminar": [id_tecnico, ...] }
+    
+    En los upserts basta con enviar id_tecnico y los campos que cambiaron
+    (ej. lat/lon, disponibilidad). Con el header If-Match el delta solo se
+    aplica si el pool sigue en esa versión; si no → 412 y Node debe hacer PUT.
+    Un delta antes del primer PUT (p. ej. tras un reinicio) también → 412.
+    """
+    try:
+        try:
+            data = decodificar_json(request.get_data())
+        except ValueError:
+            return responder({"error": "JSON inválido"}, 400)
+        
+        if not isinstance(data, dict):
+            return responder({"error": "No se recibieron datos"}, 400)
+        
+        if request.method == "PUT":
+            if not isinstance(data.get("tecnicos"), list):
+                return responder({"error": "tecnicos (lista) requerido"}, 400)
+            pool_tecnicos.reemplazar(data["tecnicos"])
+            if precalculados is not None:
+                precalculados.notificar_reemplazo()
+            return responder_pool()
+        
+        version = pool_tecnicos.aplicar_cambios(
+            upserts=data.get("upserts") or [],
+            eliminar=data.get("eliminar") or [],
+            etag_esperado=request.headers.get("If-Match")
+        )
+        if version is None:
+            return responder({"error": "Pool desincronizado", "etag": pool_tecnicos.etag}, 412)
+        if precalculados is not None:
+            precalculados.notificar_cambios(
+                [t["id_tecnico"] for t in data.get("upserts") or []] + list(data.get("eliminar") or [])
+            )
+        return responder_pool()
+    
+    except ValueError as e:
+        return responder({"error": str(e)}, 400)
+    except Exception as e:
+        return responder({"error": str(e)}, 500)
+
+@app.route("/ubicaciones", methods=["GET", "POST"])
+def ubicaciones():
+    """
+    Ingesta de ubicaciones en vivo de los técnicos (ver ubicaciones.py).
+    
+    POST: { "ubicaciones": [ { "id_tecnico", "lat", "lon", "ts"? }, ... ] }
+          o en columnas: { "id_tecnico": [...], "lat": [...], "lon": [...], "ts"?: [...] }
+          (también application/msgpack con columnas binarias)
+    GET:  estado del almacén
+    """
+    if request.method == "GET":
+        return responder(almacen_ubicaciones.estado())
+    
+    try:
+        mime_entrada = normalizar_mime(request.mimetype)
+        if mime_entrada is None:
+            return responder({"error": f"Content-Type no soportado: {request.mimetype}"}, 415)
+        
+        try:
+            data = decodificar(request.get_data(), mime_entrada)
+        except ValueError:
+            return responder({"error": "Payload inválido"}, 400)
+        
+        if not isinstance(data, dict):
+            return responder({"error": "No se recibieron datos"}, 400)
+        
+        if isinstance(data.get("ubicaciones"), list):
+            lote = data["ubicaciones"]
+            ids = [u.get("id_tecnico", -1) for u in lote]
+            lat = [u.get("lat") for u in lote]
+            lon = [u.get("lon") for u in lote]
+            ts = [u.get("ts") for u in lote]
+        elif "id_tecnico" in data:
+            ids, lat, lon = data["id_tecnico"], data.get("lat"), data.get("lon")
+            ts = data.get("ts")
+        else:
+            return responder({"error": "ubicaciones requerido"}, 400)
+        
+        # None → NaN (se descarta) / ts faltante → momento actual
+        lat = np.array(lat, dtype=float)
+        lon = np.array(lon, dtype=float)
+        if ts is not None:
+            ts = np.array(ts, dtype=float)
+            ts = np.where(np.isnan(ts), time.time(), ts)
+        
+        aceptadas, rechazadas = almacen_ubicaciones.actualizar_lote(ids, lat, lon, ts)
+        if precalculados is not None and aceptadas:
+            precalculados.notificar_cambios(ids)
+        return responder({"aceptadas": aceptadas, "rechazadas": rechazadas})
+    
+    except (TypeError, ValueError) as e:
+        return responder({"error": str(e)}, 400)
+    except Exception as e:
+        return responder({"error": str(e)}, 500)
+
+@app.route("/precomputo", methods=["GET"])
+def precomputo_estado():
+    """Estado de los rankings precalculados"""
+    if precalculados is None:
+        return responder({"activo": False})
+    return responder(precalculados.estado())
+
+@app.route("/metricas", methods=["GET"])
+def metricas():
+    """Métricas de control de carga de /recomendar (cola, en vuelo, rechazos)"""
+    if limitador is None:
+        return responder({"activo": False})
+    return responder({"activo": True, "degradar": CARGA_DEGRADAR, **limitador.estado()})
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Endpoint de salud del servicio"""
+    """Endpoint de salud del servicio (503 mientras el modelo se carga en modo ML_FAST_START)"""
     return jsonify({
-        "status": "ok",
+        "status": "ok" if listo else "iniciando",
+        "listo": listo,
         "modelo_cargado": modelo is not None,
         "scaler_cargado": scaler is not None,
-        "modelo_disponible": modelo is not None and scaler is not None
-    })
+        "modelo_disponible": modelo is not None and scaler is not None,
+        "arranque": tiempos_arranque
+    }), 200 if listo else 503
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5005, debug=True)
@@ -1,14 +1,92 @@
+import argparse
+import numpy as np
 import pandas as pd
 from db import query
-from utils import haversine
+from utils import haversine_vectorized
 
-def construir_dataset():
+# Celdas solicitud×técnico que se procesan a la vez (acota la memoria del cruce)
+CELDAS_POR_BLOQUE = 2_000_000
+
+
+def seleccionar_pares(distancias, positivos, k_cercanos, negativos_aleatorios, rng):
+    """
+    Elige qué pares solicitud-técnico entran al dataset (muestreo de negativos).
+
+    Por cada solicitud (fila) se conservan siempre los técnicos asignados,
+    los k_cercanos más cercanos y negativos_aleatorios técnicos al azar entre
+    el resto. El peso de cada par es la inversa de su probabilidad de
+    inclusión: 1 para los fijos y restantes/negativos_aleatorios para los
+    elegidos al azar.
+
+    Args:
+        distancias: Matriz (solicitudes, técnicos) en km; NaN si es desconocida
+        positivos: Matriz booleana, True donde el técnico fue asignado
+        k_cercanos: Técnicos más cercanos por solicitud (None = todos los pares)
+        negativos_aleatorios: Negativos adicionales al azar por solicitud
+        rng: np.random.Generator
+
+    Returns:
+        (filas, columnas, pesos) de los pares elegidos, ordenados por fila
+    """
+    n_sol, n_tec = distancias.shape
+    if k_cercanos is None:
+        filas, columnas = np.divmod(np.arange(n_sol * n_tec), n_tec)
+        return filas, columnas, np.ones(len(filas))
+
+    pesos = positivos.astype(np.float64)
+    if k_cercanos > 0:
+        if k_cercanos >= n_tec:
+            pesos[:] = 1
+        else:
+            cercania = np.nan_to_num(distancias, nan=np.inf)
+            cercanos = np.argpartition(cercania, k_cercanos - 1, axis=1)[:, :k_cercanos]
+            np.put_along_axis(pesos, cercanos, 1.0, axis=1)
+
+    if negativos_aleatorios > 0:
+        fijos = pesos > 0
+        restantes = n_tec - fijos.sum(axis=1)
+        m = min(negativos_aleatorios, n_tec)
+        # Los m técnicos no fijos con menor clave aleatoria son una muestra uniforme sin reemplazo
+        claves = rng.random((n_sol, n_tec))
+        claves[fijos] = np.inf
+        azar = np.argpartition(claves, m - 1, axis=1)[:, :m]
+        validos = np.isfinite(np.take_along_axis(claves, azar, axis=1))
+        peso_azar = np.maximum(restantes / negativos_aleatorios, 1.0)
+        filas_azar = np.broadcast_to(np.arange(n_sol)[:, None], azar.shape)[validos]
+        pesos[filas_azar, azar[validos]] = peso_azar[filas_azar]
+
+    filas, columnas = np.nonzero(pesos)
+    return filas, columnas, pesos[filas, columnas]
+
+
+def _unir_agregado(tecnicos, agregado, columnas):
+    """Agrega columnas por id_tecnico (0 si el técnico no tiene registros)."""
+    if agregado.empty:
+        return tecnicos.assign(**{c: 0 for c in columnas})
+    agregado = agregado.drop_duplicates("id_tecnico")[["id_tecnico", *columnas]]
+    tecnicos = tecnicos.merge(agregado, on="id_tecnico", how="left")
+    tecnicos[columnas] = tecnicos[columnas].fillna(0)
+    return tecnicos
+
+
+def construir_dataset(k_cercanos=0, negativos_aleatorios=100, semilla=42):
     """
     Construye el dataset para entrenamiento desde la base de datos.
-    Genera todas las combinaciones solicitud-técnico con sus features.
+    Por cada solicitud incluye los técnicos asignados, los k_cercanos más
+    cercanos y negativos_aleatorios técnicos al azar (ver seleccionar_pares).
+    La columna peso_muestra guarda la inversa de la probabilidad de
+    inclusión de cada fila, para evaluar sin sesgo (ver ndcg_en_k).
+    XGBRanker no admite pesos por fila: con muchos cercanos fijos el modelo
+    sobrerrepresenta esos pares, por eso k_cercanos es 0 por defecto.
+    
+    Args:
+        k_cercanos: Técnicos más cercanos por solicitud; None genera todas
+            las combinaciones solicitud-técnico
+        negativos_aleatorios: Negativos adicionales al azar por solicitud
+        semilla: Semilla del muestreo aleatorio
     
     Returns:
-        DataFrame con el dataset completo para entrenamiento
+        DataFrame con el dataset para entrenamiento
     """
     print("🔨 Construyendo dataset desde la base de datos...")
     
@@ -95,106 +173,89 @@ def construir_dataset():
         print(f"⚠ Advertencia: No se pudo cargar asignaciones: {e}")
         asignados = pd.DataFrame(columns=["id_solicitud", "id_tecnico"])
     
-    # 7. Construir dataset
-    print("🔨 Generando combinaciones solicitud-técnico...")
-    dataset = []
-    
-    for idx, sol in solicitudes.iterrows():
-        for _, tec in tecnicos.iterrows():
-            distancia = haversine(
-                sol["cliente_lat"],
-                sol["cliente_lon"],
-                tec["tecnico_lat"],
-                tec["tecnico_lon"]
-            )
-            
-            # Obtener datos agregados de forma segura
-            # Rating histórico
-            if not calificaciones.empty:
-                rating_historico = calificaciones.loc[
-                    calificaciones.id_tecnico == tec.id_tecnico, 
-                    "rating_promedio"
-                ].fillna(0).values
-                rating_historico = rating_historico[0] if len(rating_historico) > 0 else 0
-            else:
-                rating_historico = 0
-            
-            # Cantidad de calificaciones
-            if not calificaciones.empty:
-                cantidad_calif = calificaciones.loc[
-                    calificaciones.id_tecnico == tec.id_tecnico, 
-                    "cantidad_calificaciones"
-                ].fillna(0).values
-                cantidad_calif = cantidad_calif[0] if len(cantidad_calif) > 0 else 0
-            else:
-                cantidad_calif = 0
-            
-            # Precio promedio
-            if not precios.empty:
-                precio_prom = precios.loc[
-                    precios.id_tecnico == tec.id_tecnico,
-                    "precio_promedio"
-                ].fillna(0).values
-                precio_prom = precio_prom[0] if len(precio_prom) > 0 else 0
-            else:
-                precio_prom = 0
-            
-            # Ofertas totales
-            if not precios.empty:
-                ofertas_tot = precios.loc[
-                    precios.id_tecnico == tec.id_tecnico,
-                    "ofertas_totales"
-                ].fillna(0).values
-                ofertas_tot = ofertas_tot[0] if len(ofertas_tot) > 0 else 0
-            else:
-                ofertas_tot = 0
-            
-            # Servicios realizados
-            if not historial.empty:
-                serv_real = historial.loc[
-                    historial.id_tecnico == tec.id_tecnico,
-                    "servicios_realizados"
-                ].fillna(0).values
-                serv_real = serv_real[0] if len(serv_real) > 0 else 0
-            else:
-                serv_real = 0
-            
-            # Target: 1 si el técnico fue asignado a esta solicitud, 0 si no
-            target = 0
-            if not asignados.empty:
-                matches = asignados[
-                    (asignados.id_solicitud == sol.id_solicitud) & 
-                    (asignados.id_tecnico == tec.id_tecnico)
-                ]
-                target = 1 if len(matches) > 0 else 0
-            
-            dataset.append({
-                "id_solicitud": sol["id_solicitud"],
-                "id_cliente": sol["id_cliente"],
-                "id_tecnico": tec["id_tecnico"],
-                "id_categoria": sol["id_categoria"],
-                "distancia_km": distancia or 9999,
-                "rating_promedio": tec.get("calificacion_promedio", 0) or 0,
-                "historico_rating": float(rating_historico),
-                "cantidad_calificaciones": int(cantidad_calif),
-                "precio_promedio": float(precio_prom),
-                "ofertas_totales": int(ofertas_tot),
-                "servicios_realizados": int(serv_real),
-                "disponibilidad": int(tec.get("disponibilidad", True)),
-                "target": target
-            })
-    
-    df = pd.DataFrame(dataset)
+    # 7. Features por técnico (una sola vez, no por cada par)
+    tecnicos = tecnicos.drop_duplicates("id_tecnico").reset_index(drop=True)
+    tecnicos = _unir_agregado(tecnicos, calificaciones, ["rating_promedio", "cantidad_calificaciones"])
+    tecnicos = _unir_agregado(tecnicos, precios, ["precio_promedio", "ofertas_totales"])
+    tecnicos = _unir_agregado(tecnicos, historial, ["servicios_realizados"])
+    
+    # Target: posición (solicitud, técnico) de cada asignación real
+    fila_asignada = pd.Index(solicitudes["id_solicitud"]).get_indexer(asignados["id_solicitud"])
+    columna_asignada = pd.Index(tecnicos["id_tecnico"]).get_indexer(asignados["id_tecnico"])
+    conocida = (fila_asignada >= 0) & (columna_asignada >= 0)
+    fila_asignada, columna_asignada = fila_asignada[conocida], columna_asignada[conocida]
+    
+    # 8. Cruce solicitud-técnico vectorizado, por bloques de solicitudes
+    if k_cercanos is None:
+        print("🔨 Generando combinaciones solicitud-técnico...")
+    else:
+        print(f"🔨 Muestreando pares: {k_cercanos} más cercanos + {negativos_aleatorios} al azar por solicitud...")
+    
+    rng = np.random.default_rng(semilla)
+    sol_lat = pd.to_numeric(solicitudes["cliente_lat"], errors="coerce").to_numpy(dtype=np.float64)
+    sol_lon = pd.to_numeric(solicitudes["cliente_lon"], errors="coerce").to_numpy(dtype=np.float64)
+    tec_lat = pd.to_numeric(tecnicos["tecnico_lat"], errors="coerce").to_numpy(dtype=np.float64)
+    tec_lon = pd.to_numeric(tecnicos["tecnico_lon"], errors="coerce").to_numpy(dtype=np.float64)
+    n_sol, n_tec = len(solicitudes), len(tecnicos)
+    por_bloque = max(1, CELDAS_POR_BLOQUE // n_tec)
+    
+    filas, columnas, pesos, distancias, targets = [], [], [], [], []
+    for inicio in range(0, n_sol, por_bloque):
+        fin = min(inicio + por_bloque, n_sol)
+        distancia = haversine_vectorized(
+            sol_lat[inicio:fin, None], sol_lon[inicio:fin, None], tec_lat[None, :], tec_lon[None, :]
+        )
+        positivos = np.zeros((fin - inicio, n_tec), dtype=bool)
+        en_bloque = (fila_asignada >= inicio) & (fila_asignada < fin)
+        positivos[fila_asignada[en_bloque] - inicio, columna_asignada[en_bloque]] = True
+        
+        f, c, w = seleccionar_pares(distancia, positivos, k_cercanos, negativos_aleatorios, rng)
+        filas.append(f + inicio)
+        columnas.append(c)
+        pesos.append(w)
+        distancias.append(distancia[f, c])
+        targets.append(positivos[f, c])
+    
+    filas, columnas = np.concatenate(filas), np.concatenate(columnas)
+    distancias = np.concatenate(distancias)
+    
+    df = pd.DataFrame({
+        "id_solicitud": solicitudes["id_solicitud"].to_numpy()[filas],
+        "id_cliente": solicitudes["id_cliente"].to_numpy()[filas],
+        "id_tecnico": tecnicos["id_tecnico"].to_numpy()[columnas],
+        "id_categoria": solicitudes["id_categoria"].to_numpy()[filas],
+        "distancia_km": np.where(np.isnan(distancias), 9999, distancias),
+        "rating_promedio": tecnicos["calificacion_promedio"].fillna(0).to_numpy(dtype=np.float64)[columnas],
+        "historico_rating": tecnicos["rating_promedio"].to_numpy(dtype=np.float64)[columnas],
+        "cantidad_calificaciones": tecnicos["cantidad_calificaciones"].to_numpy().astype(int)[columnas],
+        "precio_promedio": tecnicos["precio_promedio"].to_numpy(dtype=np.float64)[columnas],
+        "ofertas_totales": tecnicos["ofertas_totales"].to_numpy().astype(int)[columnas],
+        "servicios_realizados": tecnicos["servicios_realizados"].to_numpy().astype(int)[columnas],
+        "disponibilidad": tecnicos["disponibilidad"].fillna(True).to_numpy().astype(int)[columnas],
+        "target": np.concatenate(targets).astype(int),
+        "peso_muestra": np.concatenate(pesos),
+    })
     
     if df.empty:
         print("❌ No se pudo generar el dataset")
         return df
     
-    print(f"✅ Dataset generado: {len(df)} filas")
+    print(f"✅ Dataset generado: {len(df)} filas (de {n_sol * n_tec} combinaciones posibles)")
     return df
 
 if __name__ == "__main__":
-    df = construir_dataset()
+    parser = argparse.ArgumentParser(description="Genera dataset_tecnicos.csv desde la base de datos")
+    parser.add_argument("--k-cercanos", type=int, default=0, help="Técnicos más cercanos por solicitud")
+    parser.add_argument("--negativos", type=int, default=100, help="Negativos al azar por solicitud")
+    parser.add_argument("--completo", action="store_true", help="Todas las combinaciones, sin muestreo")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla del muestreo")
+    args = parser.parse_args()
+    
+    df = construir_dataset(
+        k_cercanos=None if args.completo else args.k_cercanos,
+        negativos_aleatorios=args.negativos,
+        semilla=args.semilla,
+    )
     
     if not df.empty:
         df.to_csv("dataset_tecnicos.csv", index=False)
@@ -0,0 +1,101 @@
+"""
+Control de carga para /recomendar.
+
+Limita las peticiones en vuelo y encola las demás en una cola acotada con
+un presupuesto de espera. Cuando el servicio está saturado la petición se
+rechaza de inmediato (o se atiende con un camino más barato) en lugar de
+esperar sin límite y aumentar la latencia de todas las demás.
+"""
+import threading
+import time
+
+ADMITIDA = "admitida"
+COLA_LLENA = "cola_llena"
+ESPERA_AGOTADA = "espera_agotada"
+
+
+class LimitadorConcurrencia:
+    """Semáforo con cola acotada y tiempo máximo de espera en cola."""
+
+    def __init__(self, max_en_vuelo, max_cola, max_espera):
+        """
+        Args:
+            max_en_vuelo: Peticiones procesándose a la vez
+            max_cola: Peticiones que pueden esperar turno
+            max_espera: Segundos máximos de espera en cola
+        """
+        self.max_en_vuelo = max_en_vuelo
+        self.max_cola = max_cola
+        self.max_espera = max_espera
+        self._cond = threading.Condition()
+        self._en_vuelo = 0
+        self._en_cola = 0
+        self.metricas = {
+            "admitidas": 0,
+            "rechazadas_cola_llena": 0,
+            "rechazadas_espera_agotada": 0,
+            "degradadas": 0,
+            "max_cola_observada": 0,
+            "espera_total_s": 0.0,
+        }
+
+    def entrar(self):
+        """
+        Pide turno para procesar una petición.
+
+        Returns:
+            ADMITIDA, COLA_LLENA o ESPERA_AGOTADA. Si es ADMITIDA se debe
+            llamar a salir() al terminar.
+        """
+        inicio = time.monotonic()
+        with self._cond:
+            if self._en_vuelo < self.max_en_vuelo and self._en_cola == 0:
+                self._en_vuelo += 1
+                self.metricas["admitidas"] += 1
+                return ADMITIDA
+
+            if self._en_cola >= self.max_cola:
+                self.metricas["rechazadas_cola_llena"] += 1
+                return COLA_LLENA
+
+            self._en_cola += 1
+            self.metricas["max_cola_observada"] = max(self.metricas["max_cola_observada"], self._en_cola)
+            try:
+                limite = inicio + self.max_espera
+                while self._en_vuelo >= self.max_en_vuelo:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.metricas["rechazadas_espera_agotada"] += 1
+                        return ESPERA_AGOTADA
+                    self._cond.wait(restante)
+            finally:
+                self._en_cola -= 1
+
+            self._en_vuelo += 1
+            self.metricas["admitidas"] += 1
+            self.metricas["espera_total_s"] += time.monotonic() - inicio
+            return ADMITIDA
+
+    def salir(self):
+        """Libera el turno de una petición admitida."""
+        with self._cond:
+            self._en_vuelo -= 1
+            self._cond.notify()
+
+    def registrar_degradada(self):
+        """Cuenta una petición rechazada que se atendió por el camino barato."""
+        with self._cond:
+            self.metricas["degradadas"] += 1
+
+    def estado(self):
+        """Métricas actuales para el endpoint GET /metricas."""
+        with self._cond:
+            return {
+                "max_en_vuelo": self.max_en_vuelo,
+                "max_cola": self.max_cola,
+                "max_espera_s": self.max_espera,
+                "en_vuelo": self._en_vuelo,
+                "en_cola": self._en_cola,
+                **self.metricas,
+                "espera_total_s": round(self.metricas["espera_total_s"], 3),
+            }
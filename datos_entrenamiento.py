@@ -0,0 +1,178 @@
+"""
+Carga y preparación del dataset para los scripts de entrenamiento.
+
+XGBRanker asume que las filas de una misma solicitud son contiguas: los
+vectores `group`/`qid` solo describen cortes consecutivos. Aquí el dataset
+se ordena una sola vez por `id_solicitud` (orden estable, conserva el orden
+original dentro de cada solicitud) y los grupos se derivan de ese orden con
+operaciones vectorizadas.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import haversine_vectorized
+
+# Nombres de columnas de coordenadas aceptados (cliente lat/lon, técnico lat/lon)
+COLUMNAS_COORDENADAS = [
+    ("lat_cliente", "lon_cliente", "lat_tecnico", "lon_tecnico"),
+    ("cliente_lat", "cliente_lon", "tecnico_lat", "tecnico_lon"),
+]
+
+
+def cargar_dataset(ruta="dataset_tecnicos.csv"):
+    """
+    Lee el dataset de entrenamiento.
+
+    Raises:
+        FileNotFoundError: Si no existe el archivo
+        ValueError: Si el dataset está vacío o no tiene id_solicitud
+    """
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(f"{ruta} no encontrado. Ejecuta build_dataset.py primero")
+
+    df = pd.read_csv(ruta)
+
+    if df.empty:
+        raise ValueError("El dataset está vacío")
+    if "id_solicitud" not in df.columns:
+        raise ValueError("'id_solicitud' no encontrado en el dataset")
+
+    return df
+
+
+def completar_distancias(df, columna="distancia_km"):
+    """
+    Calcula con Haversine vectorizado las distancias que faltan (columna
+    ausente o valores NaN) cuando el dataset trae las coordenadas.
+
+    Args:
+        df: DataFrame del dataset (se modifica en el lugar)
+        columna: Columna de distancia a completar
+
+    Returns:
+        True si la columna existe al terminar
+    """
+    coordenadas = next(
+        (cols for cols in COLUMNAS_COORDENADAS if all(c in df.columns for c in cols)), None
+    )
+    if coordenadas is None:
+        return columna in df.columns
+
+    if columna not in df.columns:
+        df[columna] = np.nan
+
+    faltantes = df[columna].isna().to_numpy()
+    if faltantes.any():
+        lat1, lon1, lat2, lon2 = (
+            pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64)[faltantes]
+            for c in coordenadas
+        )
+        df.loc[faltantes, columna] = haversine_vectorized(lat1, lon1, lat2, lon2)
+
+    return True
+
+
+def ordenar_por_solicitud(df):
+    """
+    Ordena el dataset por id_solicitud con un orden estable (mergesort) y
+    descarta las filas sin solicitud.
+
+    Returns:
+        Nuevo DataFrame con las filas de cada solicitud contiguas
+    """
+    sin_solicitud = df["id_solicitud"].isna()
+    if sin_solicitud.any():
+        print(f"⚠ Se descartan {int(sin_solicitud.sum())} filas sin id_solicitud")
+        df = df[~sin_solicitud]
+
+    return df.sort_values("id_solicitud", kind="mergesort").reset_index(drop=True)
+
+
+def grupos_ranking(ids_solicitud):
+    """
+    Tamaños de grupo y qid para XGBRanker a partir de IDs ya ordenados.
+
+    Args:
+        ids_solicitud: IDs de solicitud ordenados (ver ordenar_por_solicitud)
+
+    Returns:
+        (group, qid): filas por solicitud en orden de aparición, y el índice
+        de grupo (0, 1, ...) de cada fila
+
+    Raises:
+        ValueError: Si los IDs no están ordenados
+    """
+    ids = np.asarray(ids_solicitud)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if (ids[1:] < ids[:-1]).any():
+        raise ValueError("Las filas deben estar ordenadas por id_solicitud")
+
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    group = np.diff(np.r_[inicios, len(ids)]).astype(np.int64)
+    qid = np.repeat(np.arange(len(group), dtype=np.int64), group)
+    return group, qid
+
+
+def preparar_ranking(df, features, target):
+    """
+    Ordena el dataset por solicitud y arma los arrays para XGBRanker.
+
+    Args:
+        df: DataFrame con id_solicitud, las features y el target
+        features: Columnas de entrada
+        target: Columna de relevancia
+
+    Returns:
+        (df_ordenado, X, y, group, qid) con X e y como arrays contiguos
+        alineados con df_ordenado
+    """
+    df = ordenar_por_solicitud(df)
+    X = np.ascontiguousarray(df[features].to_numpy(dtype=np.float64))
+    y = np.ascontiguousarray(df[target].to_numpy())
+    group, qid = grupos_ranking(df["id_solicitud"].to_numpy())
+    return df, X, y, group, qid
+
+
+def ndcg_en_k(scores, y, group, k=10, pesos=None):
+    """
+    NDCG@k promedio por solicitud, con relevancia binaria (y > 0).
+
+    Con pesos (peso_muestra de build_dataset) la posición de cada técnico
+    relevante se estima como 1 + la suma de los pesos de las filas con mayor
+    score: un negativo muestreado con probabilidad p cuenta por 1/p técnicos
+    del pool completo, así la métrica no se infla por el muestreo. Los
+    empates cuentan la mitad.
+
+    Args:
+        scores: Predicciones del modelo, alineadas con y
+        y: Relevancia de cada fila
+        group: Filas por solicitud (ver grupos_ranking)
+        k: Corte del ranking
+        pesos: Peso de muestreo por fila (None = 1)
+
+    Returns:
+        NDCG@k medio de las solicitudes con al menos una fila relevante
+        (nan si no hay ninguna)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    relevantes = np.asarray(y) > 0
+    pesos = np.ones(len(scores)) if pesos is None else np.asarray(pesos, dtype=np.float64)
+    descuentos = 1 / np.log2(np.arange(2, k + 2))
+
+    valores = []
+    for inicio, n in zip(np.r_[0, np.cumsum(group)[:-1]], group):
+        s, r, w = scores[inicio:inicio + n], relevantes[inicio:inicio + n], pesos[inicio:inicio + n]
+        if not r.any():
+            continue
+        s_rel, w_rel = s[r], w[r]
+        mayores = (s[None, :] > s_rel[:, None]) @ w
+        empates = (s[None, :] == s_rel[:, None]) @ w - w_rel
+        posicion = 1 + mayores + 0.5 * empates
+        dcg = np.where(posicion <= k, 1 / np.log2(1 + posicion), 0).sum()
+        idcg = descuentos[:min(int(r.sum()), k)].sum()
+        valores.append(dcg / idcg)
+
+    return float(np.mean(valores)) if valores else float("nan")
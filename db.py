@@ -32,3 +32,29 @@ def query(sql):
     finally:
         conn.close()
 
+
+def guardar_ubicaciones(ids, lat, lon, ts=None):
+    """
+    Inserta o actualiza en lote la última ubicación de cada técnico.
+    
+    Args:
+        ids: IDs de técnicos
+        lat: Latitudes
+        lon: Longitudes
+        ts: Timestamps de las posiciones (no se persisten; la tabla solo guarda lat/lon)
+    """
+    from psycopg2.extras import execute_values
+
+    filas = [(int(i), float(a), float(o)) for i, a, o in zip(ids, lat, lon)]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO tecnico_ubicacion (id_tecnico, lat, lon)
+                VALUES %s
+                ON CONFLICT (id_tecnico) DO UPDATE
+                SET lat = EXCLUDED.lat, lon = EXCLUDED.lon
+            """, filas)
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,223 @@
+"""
+Pool de técnicos mantenido en memoria por el servicio ML.
+
+Node.js sincroniza el pool una vez (PUT /pool/tecnicos) y luego solo envía
+cambios (upserts y eliminaciones). Así /recomendar puede recibir solo la
+solicitud, sin reenviar todos los técnicos en cada llamada.
+
+Los datos se guardan en arrays columnares compactos (una fila por técnico).
+Cada cambio incrementa la versión del pool; el ETag combina esa versión con
+un identificador de instancia para que Node detecte desincronizaciones,
+incluido un reinicio del servicio.
+"""
+import threading
+import uuid
+
+import numpy as np
+
+# Campo → (dtype, valor por defecto)
+CAMPOS = {
+    "id_tecnico": (np.int64, 0),
+    "id_usuario": (np.int64, 0),
+    "nombre": (object, "N/A"),
+    "apellido": (object, ""),
+    "lat": (np.float64, np.nan),
+    "lon": (np.float64, np.nan),
+    "calificacion_promedio": (np.float64, 0.0),
+    "cantidad_calificaciones": (np.int64, 0),
+    "precio_promedio": (np.float64, 0.0),
+    "ofertas_totales": (np.int64, 0),
+    "servicios_realizados": (np.int64, 0),
+    "disponibilidad": (np.bool_, False),
+}
+
+CAPACIDAD_INICIAL = 1024
+
+# Textos aceptados para campos booleanos (np.bool_("false") sería True)
+BOOLEANOS = {"true": True, "1": True, "false": False, "0": False}
+
+
+class PoolTecnicos:
+    """Pool de técnicos en arrays columnares, con versión para detectar drift."""
+
+    def __init__(self, capacidad=CAPACIDAD_INICIAL):
+        self._lock = threading.Lock()
+        self._instancia = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._crear_arrays(capacidad)
+
+    def _crear_arrays(self, capacidad):
+        self._n = 0
+        self._indice = {}  # id_tecnico → fila
+        self._columnas = {
+            campo: np.full(capacidad, default, dtype=dtype)
+            for campo, (dtype, default) in CAMPOS.items()
+        }
+
+    def etag_de(self, version):
+        """ETag correspondiente a una versión del pool en esta instancia."""
+        return f'"{self._instancia}-{version}"'
+
+    @property
+    def etag(self):
+        """ETag del estado actual (cambia con cada modificación o reinicio)."""
+        return self.etag_de(self.version)
+
+    @property
+    def sincronizado(self):
+        """True si Node ya cargó el pool al menos una vez."""
+        return self.version > 0
+
+    def __len__(self):
+        return self._n
+
+    def _asegurar_capacidad(self, requerida):
+        capacidad = len(self._columnas["id_tecnico"])
+        if requerida <= capacidad:
+            return
+        nueva = max(requerida, capacidad * 2)
+        for campo, (dtype, default) in CAMPOS.items():
+            arr = np.full(nueva, default, dtype=dtype)
+            arr[:self._n] = self._columnas[campo][:self._n]
+            self._columnas[campo] = arr
+
+    @staticmethod
+    def _convertir(campo, valor):
+        dtype, default = CAMPOS[campo]
+        if valor is None:
+            return default
+        if dtype is object:
+            return valor
+        if dtype is np.bool_:
+            if isinstance(valor, (bool, np.bool_)):
+                return np.bool_(valor)
+            if isinstance(valor, (int, np.integer)) and valor in (0, 1):
+                return np.bool_(valor)
+            if isinstance(valor, str) and valor.strip().lower() in BOOLEANOS:
+                return np.bool_(BOOLEANOS[valor.strip().lower()])
+            raise ValueError(f"Valor inválido para {campo}: {valor!r}")
+        try:
+            return np.dtype(dtype).type(valor)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Valor inválido para {campo}: {valor!r}")
+
+    @classmethod
+    def _normalizar(cls, tecnicos):
+        """
+        Convierte cada campo conocido al dtype de CAMPOS antes de tocar los
+        arrays, para que un valor inválido no deje el pool a medio modificar.
+
+        Raises:
+            ValueError: Si falta id_tecnico o algún valor no se puede convertir
+        """
+        if not isinstance(tecnicos, list):
+            raise ValueError("Se esperaba una lista de técnicos")
+        normalizados = []
+        for t in tecnicos:
+            if not isinstance(t, dict) or t.get("id_tecnico") is None:
+                raise ValueError("Cada técnico del pool requiere id_tecnico")
+            normalizados.append({
+                campo: cls._convertir(campo, valor) for campo, valor in t.items() if campo in CAMPOS
+            })
+        return normalizados
+
+    def _upsert(self, tecnicos):
+        for t in tecnicos:
+            id_tecnico = int(t["id_tecnico"])
+            fila = self._indice.get(id_tecnico)
+            if fila is None:
+                self._asegurar_capacidad(self._n + 1)
+                fila = self._n
+                self._n += 1
+                self._indice[id_tecnico] = fila
+                for campo, (_, default) in CAMPOS.items():
+                    self._columnas[campo][fila] = default
+            # Actualización parcial: solo los campos enviados
+            for campo, valor in t.items():
+                self._columnas[campo][fila] = valor
+
+    def _eliminar(self, ids):
+        for id_tecnico in ids:
+            fila = self._indice.pop(id_tecnico, None)
+            if fila is None:
+                continue
+            # Mover la última fila al hueco para mantener los arrays compactos
+            ultima = self._n - 1
+            if fila != ultima:
+                for arr in self._columnas.values():
+                    arr[fila] = arr[ultima]
+                self._indice[int(self._columnas["id_tecnico"][fila])] = fila
+            self._n -= 1
+
+    def reemplazar(self, tecnicos):
+        """
+        Reemplaza el pool completo (sincronización inicial o resincronización).
+
+        Args:
+            tecnicos: Lista de técnicos con el mismo formato que /recomendar
+
+        Returns:
+            Nueva versión del pool
+        """
+        tecnicos = self._normalizar(tecnicos)
+        with self._lock:
+            self._crear_arrays(max(CAPACIDAD_INICIAL, len(tecnicos)))
+            self._upsert(tecnicos)
+            self.version += 1
+            return self.version
+
+    def aplicar_cambios(self, upserts=None, eliminar=None, etag_esperado=None):
+        """
+        Aplica un delta al pool.
+
+        Args:
+            upserts: Técnicos nuevos o actualizados (campos parciales permitidos)
+            eliminar: IDs de técnicos a quitar del pool
+            etag_esperado: Si se indica, el delta solo se aplica si el pool
+                sigue en esa versión
+
+        Returns:
+            Nueva versión del pool, o None si el ETag no coincide o el pool
+            nunca recibió una sincronización completa (p. ej. tras un reinicio)
+        """
+        upserts = self._normalizar(upserts or [])
+        if not isinstance(eliminar or [], list):
+            raise ValueError("eliminar debe ser una lista de id_tecnico")
+        eliminar = [int(self._convertir("id_tecnico", i)) for i in eliminar or []]
+        with self._lock:
+            # Un delta sobre un pool vacío tras un reinicio no representa el pool de Node
+            if not self.sincronizado or (etag_esperado and etag_esperado != self.etag):
+                return None
+            self._upsert(upserts)
+            self._eliminar(eliminar)
+            self.version += 1
+            return self.version
+
+    def vista(self, solo_disponibles=True):
+        """
+        Copia columnar del pool, en el formato de `tecnicos` que acepta
+        recommender.columnas_desde_payload.
+
+        Args:
+            solo_disponibles: Excluir técnicos con disponibilidad = False
+
+        Returns:
+            (version, diccionario {campo: np.ndarray})
+        """
+        with self._lock:
+            filas = slice(0, self._n)
+            if solo_disponibles:
+                filas = np.flatnonzero(self._columnas["disponibilidad"][:self._n])
+            return self.version, {
+                campo: arr[filas].copy() for campo, arr in self._columnas.items()
+            }
+
+    def estado(self):
+        """Resumen del pool para el endpoint GET /pool."""
+        with self._lock:
+            return {
+                "version": self.version,
+                "etag": self.etag,
+                "total": self._n,
+                "disponibles": int(self._columnas["disponibilidad"][:self._n].sum()),
+            }
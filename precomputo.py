@@ -0,0 +1,284 @@
+"""
+Rankings precalculados para las solicitudes abiertas.
+
+Un hilo en segundo plano rankea contra el pool de técnicos las solicitudes
+en estado `pendiente`/`con_ofertas` y guarda el top-K de cada una, para que
+/recomendar las sirva sin volver a puntuar todo el pool.
+
+Cuando cambian datos de técnicos (pool o ubicaciones en vivo), solo se
+invalidan las solicitudes afectadas:
+- las que tienen a alguno de esos técnicos en su top-K (de inmediato), y
+- las que tienen a uno de ellos con un score nuevo mayor que su K-ésimo
+  score (en la siguiente pasada del hilo, con una sola predicción).
+
+Una solicitud invalidada se sirve con scoring en vivo hasta que el hilo la
+vuelve a rankear.
+"""
+import threading
+import time
+
+import numpy as np
+
+from recommender import (
+    cargar_modelo_recomendacion, columnas_desde_payload, ordenar_por_score, puntuar,
+)
+
+SQL_SOLICITUDES_ABIERTAS = """
+    SELECT id_solicitud, lat, lon
+    FROM solicitud_servicio
+    WHERE estado IN ('pendiente', 'con_ofertas')
+"""
+
+
+# Diferencia máxima en grados para considerar la misma ubicación (~1 cm)
+TOLERANCIA_COORDENADAS = 1e-7
+
+
+def _coordenadas(solicitud):
+    """(lat, lon) como float (la BD puede devolver Decimal); NaN si falta."""
+    return np.array([
+        np.nan if solicitud.get(c) is None else float(solicitud.get(c)) for c in ("lat", "lon")
+    ])
+
+
+def _ubicacion(solicitud):
+    """{"lat", "lon"} con float (o None), lista para columnas_desde_payload."""
+    lat, lon = _coordenadas(solicitud)
+    return {"lat": None if np.isnan(lat) else float(lat), "lon": None if np.isnan(lon) else float(lon)}
+
+
+def _misma_ubicacion(a, b):
+    return bool(np.isclose(_coordenadas(a), _coordenadas(b), rtol=0,
+                           atol=TOLERANCIA_COORDENADAS, equal_nan=True).all())
+
+
+class RankingsPrecalculados:
+    """Top-K por solicitud abierta, invalidado selectivamente ante cambios."""
+
+    def __init__(self, fuente_tecnicos, top_k=20):
+        """
+        Args:
+            fuente_tecnicos: Función sin argumentos que devuelve
+                (version, {campo: np.ndarray}) con los técnicos disponibles
+            top_k: Cantidad de técnicos guardados por solicitud
+        """
+        self._fuente = fuente_tecnicos
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        # id_solicitud → {"solicitud", "columnas", "umbral", "sucia"}
+        self._entradas = {}
+        self._hilo = None
+        # Técnicos cambiados aún no revisados contra los top-K
+        self._cambios_pendientes = set()
+        # Se incrementa con cada notificación; detecta cambios durante un ranqueo
+        self._generacion = 0
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "reranqueos": 0, "invalidaciones": 0}
+
+    def _recortar(self, columnas):
+        """Top-K de un ranking columnar ya ordenado y su score de corte."""
+        top = {c: np.asarray(v)[:self.top_k] for c, v in columnas.items()}
+        scores = top.get("score", np.empty(0))
+        # Con menos de K técnicos cualquier técnico nuevo entra al top-K
+        umbral = float(scores[-1]) if len(scores) >= self.top_k else -np.inf
+        return top, umbral
+
+    def generacion(self):
+        """Marca a tomar antes de leer el pool para un ranking (ver guardar)."""
+        with self._lock:
+            return self._generacion
+
+    def guardar(self, id_solicitud, solicitud, columnas, generacion):
+        """
+        Guarda un ranking completo ya ordenado (p. ej. calculado en vivo).
+
+        Args:
+            id_solicitud: ID de la solicitud
+            solicitud: { "lat", "lon", ... }
+            columnas: Ranking columnar ordenado por score
+            generacion: Valor de generacion() antes de calcular el ranking; si
+                hubo cambios mientras tanto el ranking se guarda como inválido
+        """
+        top, umbral = self._recortar(columnas)
+        with self._lock:
+            self._entradas[id_solicitud] = {
+                "solicitud": _ubicacion(solicitud),
+                "columnas": top,
+                "umbral": umbral,
+                "sucia": generacion != self._generacion,
+            }
+
+    def obtener(self, id_solicitud, solicitud):
+        """
+        Ranking precalculado vigente para una solicitud.
+
+        Args:
+            id_solicitud: ID de la solicitud
+            solicitud: { "lat", "lon", ... } recibida en la petición
+
+        Returns:
+            Top-K columnar, o None si no hay ranking vigente
+        """
+        with self._lock:
+            entrada = self._entradas.get(id_solicitud)
+            vigente = (
+                entrada is not None
+                and not entrada["sucia"]
+                and _misma_ubicacion(entrada["solicitud"], solicitud)
+            )
+            self.estadisticas["aciertos" if vigente else "fallos"] += 1
+            return entrada["columnas"] if vigente else None
+
+    def rankear(self, id_solicitud, solicitud):
+        """Rankea una solicitud contra el pool actual y guarda su top-K."""
+        cargar_modelo_recomendacion()
+        generacion = self.generacion()
+        _, tecnicos = self._fuente()
+        columnas = columnas_desde_payload({"solicitud": solicitud, "tecnicos": tecnicos})
+        if len(columnas["id_tecnico"]) == 0:
+            ordenadas = {}
+        else:
+            ordenadas = ordenar_por_score(columnas, puntuar(columnas), columnar=True)
+        self.guardar(id_solicitud, solicitud, ordenadas, generacion)
+        self.estadisticas["reranqueos"] += 1
+
+    def notificar_reemplazo(self):
+        """El pool se reemplazó completo: todos los rankings quedan inválidos."""
+        with self._lock:
+            self._generacion += 1
+            for entrada in self._entradas.values():
+                entrada["sucia"] = True
+            self.estadisticas["invalidaciones"] += len(self._entradas)
+
+    def notificar_cambios(self, ids_tecnicos):
+        """
+        Invalida de inmediato las solicitudes que tienen a estos técnicos en
+        su top-K (cambiaron, se eliminaron o dejaron de estar disponibles) y
+        encola los técnicos para revisar si ahora entran a otros top-K.
+
+        Args:
+            ids_tecnicos: IDs de técnicos actualizados, eliminados o que se movieron
+        """
+        ids_tecnicos = np.asarray(ids_tecnicos, dtype=np.int64)
+        if len(ids_tecnicos) == 0:
+            return
+
+        with self._lock:
+            self._generacion += 1
+            self._cambios_pendientes.update(ids_tecnicos.tolist())
+            for entrada in self._entradas.values():
+                ids_top = entrada["columnas"].get("id_tecnico")
+                if not entrada["sucia"] and ids_top is not None and np.isin(ids_top, ids_tecnicos).any():
+                    entrada["sucia"] = True
+                    self.estadisticas["invalidaciones"] += 1
+
+    def procesar_cambios(self):
+        """
+        Puntúa los técnicos encolados contra todas las solicitudes vigentes en
+        una sola predicción e invalida aquellas donde alguno supera el K-ésimo score.
+        """
+        with self._lock:
+            ids_tecnicos = np.fromiter(self._cambios_pendientes, dtype=np.int64)
+            self._cambios_pendientes.clear()
+            vigentes = {i: e for i, e in self._entradas.items() if not e["sucia"]}
+        if len(ids_tecnicos) == 0 or not vigentes:
+            return
+
+        _, tecnicos = self._fuente()
+        filas = np.isin(tecnicos["id_tecnico"], ids_tecnicos)
+        n = int(filas.sum())
+        if n == 0:
+            return
+
+        cargar_modelo_recomendacion()
+        cambiados = {c: v[filas] for c, v in tecnicos.items()}
+        ids = list(vigentes)
+        bloques = [
+            columnas_desde_payload({"solicitud": vigentes[i]["solicitud"], "tecnicos": cambiados})
+            for i in ids
+        ]
+        todas = {c: np.concatenate([b[c] for b in bloques]) for c in bloques[0]}
+        scores = puntuar(todas).reshape(len(ids), n)
+
+        with self._lock:
+            for i, fila in zip(ids, scores):
+                entrada = self._entradas.get(i)
+                if entrada is not None and not entrada["sucia"] and fila.max() > entrada["umbral"]:
+                    entrada["sucia"] = True
+                    self.estadisticas["invalidaciones"] += 1
+
+    def sincronizar_abiertas(self):
+        """
+        Registra las solicitudes abiertas de la BD y descarta las cerradas.
+        Si la BD no está disponible se conservan las solicitudes ya conocidas.
+        """
+        from db import query
+
+        try:
+            abiertas = query(SQL_SOLICITUDES_ABIERTAS)
+        except Exception as e:
+            print(f"⚠ No se pudieron leer solicitudes abiertas: {e}")
+            return
+
+        ids = set(abiertas["id_solicitud"].tolist())
+        with self._lock:
+            for id_solicitud in list(self._entradas):
+                if id_solicitud not in ids:
+                    del self._entradas[id_solicitud]
+            for fila in abiertas.itertuples(index=False):
+                if fila.id_solicitud not in self._entradas:
+                    self._entradas[fila.id_solicitud] = {
+                        "solicitud": _ubicacion({"lat": fila.lat, "lon": fila.lon}),
+                        "columnas": {},
+                        "umbral": -np.inf,
+                        "sucia": True,
+                    }
+
+    def rankear_pendientes(self):
+        """Vuelve a rankear todas las solicitudes invalidadas o nuevas."""
+        with self._lock:
+            pendientes = [(i, e["solicitud"]) for i, e in self._entradas.items() if e["sucia"]]
+        for id_solicitud, solicitud in pendientes:
+            try:
+                self.rankear(id_solicitud, solicitud)
+            except Exception as e:
+                print(f"⚠ Error al precalcular solicitud {id_solicitud}: {e}")
+
+    def estado(self):
+        """Resumen para el endpoint GET /precomputo."""
+        with self._lock:
+            sucias = sum(1 for e in self._entradas.values() if e["sucia"])
+            return {
+                "top_k": self.top_k,
+                "solicitudes": len(self._entradas),
+                "vigentes": len(self._entradas) - sucias,
+                "invalidadas": sucias,
+                "activo": self._hilo is not None,
+                **self.estadisticas,
+            }
+
+    def iniciar(self, intervalo, refresco_abiertas=30):
+        """
+        Lanza el hilo que mantiene los rankings al día.
+
+        Args:
+            intervalo: Segundos entre pasadas de re-ranqueo
+            refresco_abiertas: Segundos entre lecturas de solicitudes abiertas en la BD
+        """
+        if self._hilo is not None:
+            return
+
+        def ciclo():
+            ultima_lectura = 0
+            while True:
+                if time.monotonic() - ultima_lectura >= refresco_abiertas:
+                    self.sincronizar_abiertas()
+                    ultima_lectura = time.monotonic()
+                try:
+                    self.procesar_cambios()
+                except Exception as e:
+                    print(f"⚠ Error al revisar cambios de técnicos: {e}")
+                self.rankear_pendientes()
+                time.sleep(intervalo)
+
+        self._hilo = threading.Thread(target=ciclo, name="precomputo-rankings", daemon=True)
+        self._hilo.start()
@@ -0,0 +1,436 @@
+"""
+Prueba de carga local para la API a partir de POSTMAN_COLLECTION.json.
+
+Reproduce las peticiones de la colección con concurrencia y tasa de llegada
+configurables, contra la app en el mismo proceso (cliente de pruebas de
+Flask) o contra un servidor en localhost, y reporta throughput, latencias
+p50/p95/p99 y tasa de errores.
+
+Las peticiones a /recomendar se completan según --modo:
+    legacy:  solo id_solicitud, como en la colección (usa la BD; con
+             --bd-simulada se reemplaza db.query por datos sintéticos)
+    payload: solicitud + --pool técnicos sintéticos en el body
+    pool:    solicitud sola; antes se sincroniza el pool con PUT /pool/tecnicos
+
+Ejemplos:
+    python prueba_carga.py --modo payload --pool 500 --concurrencia 8 --peticiones 2000
+    python prueba_carga.py --modo legacy --bd-simulada --rps 50 --duracion 30
+    python prueba_carga.py --url http://localhost:5005 --modo pool --pool 5000
+"""
+import argparse
+import json
+import queue
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Centro de la zona de servicio (Santa Cruz) para coordenadas sintéticas
+CENTRO = (-17.7833, -63.1821)
+DISPERSION_GRADOS = 0.08
+MODOS = ["legacy", "payload", "pool"]
+
+
+def cargar_plantillas(ruta="POSTMAN_COLLECTION.json"):
+    """
+    Lee las peticiones de una colección de Postman (incluidas carpetas).
+
+    Returns:
+        Lista de { "nombre", "metodo", "ruta", "body" } con body ya parseado (o None)
+    """
+    with open(ruta, encoding="utf-8") as f:
+        coleccion = json.load(f)
+
+    plantillas = []
+    pendientes = list(coleccion.get("item", []))
+    while pendientes:
+        item = pendientes.pop(0)
+        if "item" in item:
+            pendientes[:0] = item["item"]
+            continue
+
+        peticion = item["request"]
+        url = peticion["url"] if isinstance(peticion["url"], str) else peticion["url"].get("raw", "")
+        crudo = (peticion.get("body") or {}).get("raw")
+        plantillas.append({
+            "nombre": item["name"],
+            "metodo": peticion.get("method", "GET"),
+            "ruta": urlparse(url).path or "/",
+            "body": json.loads(crudo) if crudo else None,
+        })
+    return plantillas
+
+
+def generar_tecnicos(n, rng):
+    """Técnicos sintéticos con el formato del payload de Node.js."""
+    return [
+        {
+            "id_tecnico": i,
+            "nombre": f"Tecnico{i}",
+            "apellido": "Prueba",
+            "calificacion_promedio": round(rng.uniform(1, 5), 2),
+            "lat": CENTRO[0] + rng.gauss(0, DISPERSION_GRADOS),
+            "lon": CENTRO[1] + rng.gauss(0, DISPERSION_GRADOS),
+            "servicios_realizados": rng.randint(0, 80),
+            "disponibilidad": True,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def bd_simulada(n_tecnicos, n_solicitudes, semilla=0):
+    """
+    Función con la firma de db.query que responde con DataFrames sintéticos
+    a las consultas del modo legacy y del precómputo.
+
+    Args:
+        n_tecnicos: Técnicos en la tabla tecnico
+        n_solicitudes: Solicitudes con id_solicitud 1..n_solicitudes
+        semilla: Semilla de los datos
+
+    Returns:
+        Función query(sql) → DataFrame
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(semilla)
+    ids = np.arange(1, n_tecnicos + 1)
+    solicitudes = pd.DataFrame({
+        "id_solicitud": np.arange(1, n_solicitudes + 1),
+        "id_cliente": rng.integers(1, 1000, n_solicitudes),
+        "id_categoria": rng.integers(1, 10, n_solicitudes),
+        "cliente_lat": CENTRO[0] + rng.normal(0, DISPERSION_GRADOS, n_solicitudes),
+        "cliente_lon": CENTRO[1] + rng.normal(0, DISPERSION_GRADOS, n_solicitudes),
+    })
+    solicitudes["lat"], solicitudes["lon"] = solicitudes["cliente_lat"], solicitudes["cliente_lon"]
+    tecnicos = pd.DataFrame({
+        "id_tecnico": ids,
+        "tecnico_lat": CENTRO[0] + rng.normal(0, DISPERSION_GRADOS, n_tecnicos),
+        "tecnico_lon": CENTRO[1] + rng.normal(0, DISPERSION_GRADOS, n_tecnicos),
+        "calificacion_promedio": rng.uniform(1, 5, n_tecnicos).round(2),
+        "disponibilidad": True,
+    })
+    cantidad = rng.integers(0, 40, n_tecnicos)
+    calificaciones = pd.DataFrame({
+        "id_tecnico": ids,
+        "rating_promedio": rng.uniform(1, 5, n_tecnicos),
+        "cantidad": cantidad,
+        "cantidad_calificaciones": cantidad,
+    })
+    precios = pd.DataFrame({
+        "id_tecnico": ids,
+        "precio_promedio": rng.uniform(50, 500, n_tecnicos).round(2),
+        "ofertas_totales": rng.integers(0, 60, n_tecnicos),
+    })
+    historial = pd.DataFrame({"id_tecnico": ids, "servicios_realizados": rng.integers(0, 80, n_tecnicos)})
+    asignados = pd.DataFrame({
+        "id_solicitud": solicitudes["id_solicitud"],
+        "id_tecnico": rng.choice(ids, n_solicitudes),
+    })
+
+    def query(sql):
+        if "FROM solicitud_servicio" in sql:
+            filtro = re.search(r"id_solicitud\s*=\s*(\d+)", sql)
+            if filtro:
+                return solicitudes[solicitudes["id_solicitud"] == int(filtro.group(1))].reset_index(drop=True)
+            return solicitudes.copy()
+        if "FROM tecnico t" in sql:
+            return tecnicos.copy()
+        if "FROM calificacion" in sql:
+            return calificaciones
+        if "FROM oferta_tecnico" in sql:
+            return precios
+        if "servicios_realizados" in sql:
+            return historial
+        if "FROM servicio_asignado" in sql:
+            return asignados
+        raise ValueError(f"Consulta no simulada: {sql.strip()[:80]}")
+
+    return query
+
+
+def construir_escenarios(plantillas, modo, tecnicos, filtro=None):
+    """
+    Arma las peticiones a reproducir con el body ya codificado.
+
+    Args:
+        plantillas: Resultado de cargar_plantillas
+        modo: "legacy", "payload" o "pool"
+        tecnicos: Técnicos sintéticos (modo payload)
+        filtro: Texto que debe aparecer en el nombre de la petición (None = todas)
+
+    Returns:
+        Lista de { "nombre", "metodo", "ruta", "cuerpo" (bytes o None) }
+    """
+    escenarios = []
+    for i, plantilla in enumerate(plantillas):
+        if filtro and filtro.lower() not in plantilla["nombre"].lower():
+            continue
+
+        body = plantilla["body"]
+        if plantilla["ruta"] == "/recomendar" and isinstance(body, dict) and "id_solicitud" in body:
+            # Cada solicitud de la colección en un punto distinto (determinista)
+            rng = random.Random(i)
+            solicitud = {
+                "lat": CENTRO[0] + rng.gauss(0, DISPERSION_GRADOS),
+                "lon": CENTRO[1] + rng.gauss(0, DISPERSION_GRADOS),
+            }
+            if modo == "payload":
+                body = dict(body, solicitud=solicitud, tecnicos=tecnicos)
+            elif modo == "pool":
+                body = dict(body, solicitud=solicitud)
+
+        escenarios.append({
+            "nombre": plantilla["nombre"],
+            "metodo": plantilla["metodo"],
+            "ruta": plantilla["ruta"],
+            "cuerpo": json.dumps(body).encode() if body is not None else None,
+        })
+    return escenarios
+
+
+class ClienteEnProceso:
+    """Envía peticiones con el cliente de pruebas de Flask (uno por hilo)."""
+
+    def __init__(self):
+        import app
+        self._app = app.app
+        self._local = threading.local()
+
+    def enviar(self, metodo, ruta, cuerpo):
+        """Returns: (status, header X-Scorer o None)"""
+        cliente = getattr(self._local, "cliente", None)
+        if cliente is None:
+            cliente = self._local.cliente = self._app.test_client()
+        respuesta = cliente.open(ruta, method=metodo, data=cuerpo, content_type="application/json")
+        return respuesta.status_code, respuesta.headers.get("X-Scorer")
+
+
+class ClienteHttp:
+    """Envía peticiones HTTP a un servidor ya levantado (urllib)."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def enviar(self, metodo, ruta, cuerpo):
+        """Returns: (status, header X-Scorer o None)"""
+        peticion = urllib.request.Request(
+            self.url + ruta, data=cuerpo, method=metodo, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+                respuesta.read()
+                return respuesta.status, respuesta.headers.get("X-Scorer")
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get("X-Scorer")
+
+
+def esperar_listo(cliente, timeout=120):
+    """Espera a que /health responda 200 (modelo cargado con ML_FAST_START)."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if cliente.enviar("GET", "/health", None)[0] == 200:
+                return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def ejecutar(cliente, escenarios, peticiones, concurrencia, rps=0, duracion=None, semilla=0):
+    """
+    Lanza la carga y mide cada petición.
+
+    Con rps > 0 las llegadas son de Poisson (carga abierta) y la latencia se
+    mide desde el instante programado de llegada, incluida la espera por un
+    hilo libre; con rps = 0 cada hilo envía la siguiente petición apenas
+    recibe la respuesta (carga cerrada).
+
+    Args:
+        cliente: ClienteEnProceso o ClienteHttp
+        escenarios: Resultado de construir_escenarios
+        peticiones: Total de peticiones a enviar
+        concurrencia: Hilos que envían peticiones
+        rps: Tasa de llegada en peticiones por segundo (0 = sin límite)
+        duracion: Segundos máximos de la prueba (None = sin límite)
+        semilla: Semilla de la elección de escenarios y las llegadas
+
+    Returns:
+        (resultados, segundos): lista de (escenario, status, scorer, latencia_s)
+        y duración total de la prueba
+    """
+    rng = random.Random(semilla)
+    # Con carga cerrada la cola acotada hace que los hilos marquen el ritmo
+    trabajos = queue.Queue(maxsize=0 if rps > 0 else concurrencia)
+    resultados = []
+
+    def trabajador():
+        while True:
+            trabajo = trabajos.get()
+            if trabajo is None:
+                return
+            escenario, llegada = trabajo
+            inicio = llegada if llegada is not None else time.perf_counter()
+            try:
+                status, scorer = cliente.enviar(escenario["metodo"], escenario["ruta"], escenario["cuerpo"])
+            except Exception:
+                status, scorer = None, None
+            resultados.append((escenario["nombre"], status, scorer, time.perf_counter() - inicio))
+
+    hilos = [threading.Thread(target=trabajador, daemon=True) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+
+    inicio = time.perf_counter()
+    limite = inicio + duracion if duracion else None
+    proxima = inicio
+    for _ in range(peticiones):
+        if rps > 0:
+            proxima += rng.expovariate(rps)
+            espera = proxima - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+        if limite is not None and time.perf_counter() >= limite:
+            break
+        trabajos.put((rng.choice(escenarios), proxima if rps > 0 else None))
+
+    for _ in hilos:
+        trabajos.put(None)
+    for hilo in hilos:
+        hilo.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def _latencias(valores):
+    ms = np.asarray(valores) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(ms.max()), 2),
+        "media": round(float(ms.mean()), 2),
+    }
+
+
+def resumir(resultados, segundos):
+    """
+    Métricas de la prueba. Son errores los 5xx (salvo 503 por carga, que
+    se cuentan aparte como rechazos junto con los 429) y las peticiones
+    sin respuesta.
+    """
+    if not resultados:
+        return {"peticiones": 0}
+
+    nombres, status, scorers, latencias = zip(*resultados)
+    status = np.array([s if s is not None else 0 for s in status])
+    rechazos = np.isin(status, [429, 503])
+    errores = ((status >= 500) | (status == 0)) & ~rechazos
+
+    por_escenario = {}
+    for nombre in dict.fromkeys(nombres):
+        filas = [i for i, n in enumerate(nombres) if n == nombre]
+        por_escenario[nombre] = {
+            "peticiones": len(filas),
+            "codigos": dict(Counter(int(s) for s in status[filas])),
+            "latencia_ms": _latencias([latencias[i] for i in filas]),
+        }
+
+    return {
+        "peticiones": len(resultados),
+        "duracion_s": round(segundos, 3),
+        "throughput_rps": round(len(resultados) / segundos, 2),
+        "latencia_ms": _latencias(latencias),
+        "tasa_error": round(float(errores.mean()), 4),
+        "tasa_rechazo": round(float(rechazos.mean()), 4),
+        "tasa_no_2xx": round(float(((status < 200) | (status >= 300)).mean()), 4),
+        "codigos": dict(Counter(int(s) for s in status)),
+        "scorer": dict(Counter(s for s in scorers if s)),
+        "por_escenario": por_escenario,
+    }
+
+
+def imprimir(resumen):
+    """Resumen legible en consola."""
+    if not resumen["peticiones"]:
+        print("⚠ No se envió ninguna petición")
+        return
+
+    lat = resumen["latencia_ms"]
+    print(f"📊 {resumen['peticiones']} peticiones en {resumen['duracion_s']} s "
+          f"→ {resumen['throughput_rps']} req/s")
+    print(f"⏱ Latencia (ms): p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    print(f"❌ Errores: {resumen['tasa_error']:.2%}  |  🚦 Rechazos (429/503): {resumen['tasa_rechazo']:.2%}  "
+          f"|  No 2xx: {resumen['tasa_no_2xx']:.2%}")
+    print(f"   Códigos: {resumen['codigos']}")
+    if resumen["scorer"]:
+        print(f"   Scorer: {resumen['scorer']}")
+    for nombre, datos in resumen["por_escenario"].items():
+        lat = datos["latencia_ms"]
+        print(f"   - {nombre}: {datos['peticiones']} peticiones, p50={lat['p50']} p95={lat['p95']} "
+              f"p99={lat['p99']} ms, códigos {datos['codigos']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con POSTMAN_COLLECTION.json")
+    parser.add_argument("--coleccion", default="POSTMAN_COLLECTION.json", help="Colección de Postman")
+    parser.add_argument("--url", help="Servidor a probar (ej. http://localhost:5005); sin --url, en proceso")
+    parser.add_argument("--modo", choices=MODOS, default="payload", help="Cómo se completan las peticiones a /recomendar")
+    parser.add_argument("--escenarios", help="Solo las peticiones cuyo nombre contiene este texto")
+    parser.add_argument("--pool", type=int, default=200, help="Técnicos por petición (payload) o en el pool / BD simulada")
+    parser.add_argument("--solicitudes", type=int, default=200, help="Solicitudes en la BD simulada")
+    parser.add_argument("--bd-simulada", action="store_true", help="Reemplaza db.query por datos sintéticos (en proceso)")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Hilos que envían peticiones")
+    parser.add_argument("--rps", type=float, default=0, help="Tasa de llegada (0 = carga cerrada, sin límite)")
+    parser.add_argument("--peticiones", type=int, default=1000, help="Total de peticiones")
+    parser.add_argument("--duracion", type=float, help="Segundos máximos de la prueba")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla de datos y llegadas")
+    parser.add_argument("--json", action="store_true", help="Imprime el resumen como JSON")
+    args = parser.parse_args()
+
+    if args.bd_simulada and args.url:
+        parser.error("--bd-simulada solo aplica a la prueba en proceso (sin --url)")
+
+    if args.bd_simulada:
+        import db
+        db.query = bd_simulada(args.pool, args.solicitudes, args.semilla)
+
+    cliente = ClienteHttp(args.url) if args.url else ClienteEnProceso()
+    if not esperar_listo(cliente):
+        print("❌ El servicio no respondió /health a tiempo")
+        raise SystemExit(1)
+
+    tecnicos = generar_tecnicos(args.pool, random.Random(args.semilla))
+    if args.modo == "pool":
+        status, _ = cliente.enviar("PUT", "/pool/tecnicos", json.dumps({"tecnicos": tecnicos}).encode())
+        if status != 200:
+            print(f"❌ No se pudo sincronizar el pool (HTTP {status})")
+            raise SystemExit(1)
+
+    escenarios = construir_escenarios(
+        cargar_plantillas(args.coleccion), args.modo, tecnicos if args.modo == "payload" else None,
+        args.escenarios,
+    )
+    if not escenarios:
+        print("❌ Ningún escenario coincide con el filtro")
+        raise SystemExit(1)
+
+    print(f"🚀 {len(escenarios)} escenarios, modo {args.modo}, concurrencia {args.concurrencia}, "
+          f"rps {args.rps or 'sin límite'}, {'HTTP ' + args.url if args.url else 'en proceso'}")
+    resultados, segundos = ejecutar(
+        cliente, escenarios, args.peticiones, args.concurrencia, args.rps, args.duracion, args.semilla
+    )
+    resumen = resumir(resultados, segundos)
+    if args.json:
+        print(json.dumps(resumen, indent=2, ensure_ascii=False))
+    else:
+        imprimir(resumen)
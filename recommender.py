@@ -1,9 +1,13 @@
-import pandas as pd
 import joblib
 import numpy as np
 import os
-from db import query
-from utils import haversine
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from decouple import config
+from ubicaciones import almacen_ubicaciones
+from utils import haversine_vectorized
 
 # -----------------------------
 # VARIABLES GLOBALES PARA MODELO Y SCALER
@@ -30,12 +34,257 @@ def cargar_modelo_recomendacion():
             raise Exception(f"Error al cargar modelo: {e}")
 
 
+# -----------------------------
+# FEATURES Y SCORING COLUMNAR
+# -----------------------------
+# Scorer de respaldo (sin modelo): pesos y escalas
+PESOS_FALLBACK = {
+    "distancia": 0.40,
+    "rating": 0.35,
+    "servicios": 0.15,
+    "disponibilidad": 0.10,
+}
+ESCALA_DISTANCIA_KM = 5.0
+SERVICIOS_REFERENCIA = 50
+
+# Hilos para predicciones con deadline (ver rankear). El semáforo limita las
+# predicciones en curso o en cola a MODELO_HILOS: si el modelo está lento no
+# se acumulan trabajos y la petición pasa directo al scorer de respaldo
+MODELO_HILOS = config("MODELO_HILOS", default=4, cast=int)
+_ejecutor_prediccion = ThreadPoolExecutor(max_workers=MODELO_HILOS, thread_name_prefix="prediccion")
+_cupos_prediccion = threading.BoundedSemaphore(MODELO_HILOS)
+
+# Distancia para técnicos sin coordenadas (el dataset de entrenamiento usa el mismo valor)
+DISTANCIA_DESCONOCIDA_KM = 9999.0
+
+FEATURES = [
+    "distancia_km",
+    "rating_promedio",
+    "historico_rating",
+    "cantidad_calificaciones",
+    "precio_promedio",
+    "ofertas_totales",
+    "servicios_realizados",
+    "disponibilidad",
+]
+
+
+def _num_tecnicos(tecnicos):
+    """Cantidad de técnicos, ya sea lista de objetos o diccionario de columnas."""
+    if isinstance(tecnicos, dict):
+        return len(tecnicos.get("id_tecnico", ()))
+    return len(tecnicos)
+
+
+def _columna(tecnicos, campo, dtype, default=0):
+    """
+    Extrae un campo de los técnicos como array de NumPy (None/nulos → default).
+
+    Acepta la lista de objetos de JSON o un diccionario de columnas
+    (MessagePack/Arrow); en el segundo caso los arrays numéricos se usan
+    sin copiar cuando ya tienen el dtype pedido.
+    """
+    n = _num_tecnicos(tecnicos)
+    if isinstance(tecnicos, dict):
+        valores = tecnicos.get(campo)
+        if valores is None:
+            return np.full(n, default, dtype=dtype)
+        arr = np.asarray(valores)
+        if arr.dtype == object:
+            arr = np.array([default if v is None else v for v in arr], dtype=dtype)
+        elif arr.dtype.kind == "f" and not np.isnan(default):
+            # Los nulos de Arrow llegan como NaN
+            arr = np.where(np.isnan(arr), default, arr)
+        return arr.astype(dtype, copy=False)
+
+    valores = (t.get(campo, default) for t in tecnicos)
+    return np.fromiter(
+        (default if v is None else v for v in valores),
+        dtype=dtype,
+        count=n,
+    )
+
+
+def _texto(tecnicos, campo, default):
+    """Extrae un campo de texto de los técnicos como array de objetos."""
+    if isinstance(tecnicos, dict):
+        valores = tecnicos.get(campo)
+        if valores is None:
+            return np.full(_num_tecnicos(tecnicos), default, dtype=object)
+        return np.array([default if v is None else v for v in valores], dtype=object)
+    return np.array([t.get(campo, default) for t in tecnicos], dtype=object)
+
+
+def columnas_desde_payload(payload):
+    """
+    Convierte el payload de Node.js en arrays columnares listos para el modelo.
+    Calcula todas las distancias en un solo paso con Haversine vectorizado.
+
+    Args:
+        payload: {
+            "solicitud": {...},
+            "tecnicos": [ {...}, ... ]  o  { "id_tecnico": [...], "lat": [...], ... }
+        }
+
+    Returns:
+        Diccionario {columna: np.ndarray}, en el orden de salida de la respuesta
+    """
+    sol_data = payload["solicitud"]
+    tecnicos_data = payload["tecnicos"]
+
+    cliente_lat = sol_data.get("lat", 0)
+    cliente_lon = sol_data.get("lon", 0)
+
+    # Coordenadas faltantes → NaN → DISTANCIA_DESCONOCIDA_KM (igual que build_dataset y el modo legacy)
+    tecnico_lat = _columna(tecnicos_data, "lat", np.float64, default=np.nan)
+    tecnico_lon = _columna(tecnicos_data, "lon", np.float64, default=np.nan)
+    if cliente_lat is None or cliente_lon is None:
+        distancia = np.full(len(tecnico_lat), DISTANCIA_DESCONOCIDA_KM)
+    else:
+        distancia = haversine_vectorized(cliente_lat, cliente_lon, tecnico_lat, tecnico_lon)
+        distancia = np.nan_to_num(distancia, nan=DISTANCIA_DESCONOCIDA_KM)
+
+    rating = _columna(tecnicos_data, "calificacion_promedio", np.float64)
+
+    return {
+        "id_tecnico": _columna(tecnicos_data, "id_tecnico", np.int64),
+        "nombre": _texto(tecnicos_data, "nombre", "N/A"),
+        "apellido": _texto(tecnicos_data, "apellido", ""),
+        "distancia_km": distancia,
+        "rating_promedio": rating,
+        "historico_rating": rating,
+        "cantidad_calificaciones": _columna(tecnicos_data, "cantidad_calificaciones", np.int64),
+        "precio_promedio": _columna(tecnicos_data, "precio_promedio", np.float64),
+        "ofertas_totales": _columna(tecnicos_data, "ofertas_totales", np.int64),
+        "servicios_realizados": _columna(tecnicos_data, "servicios_realizados", np.int64),
+        "disponibilidad": (_columna(tecnicos_data, "disponibilidad", np.float64) != 0).astype(np.int64),
+    }
+
+
+def modelo_disponible():
+    """True si el modelo y el scaler están (o se pueden) cargar."""
+    try:
+        cargar_modelo_recomendacion()
+        return True
+    except Exception:
+        return False
+
+
+def puntuar(columnas):
+    """
+    Escala las features y obtiene el score del modelo para cada técnico.
+
+    Args:
+        columnas: Diccionario {columna: np.ndarray} con todas las FEATURES
+
+    Returns:
+        np.ndarray con un score por técnico
+    """
+    X = np.column_stack([np.asarray(columnas[f], dtype=np.float64) for f in FEATURES])
+    # El scaler se entrenó con un DataFrame; el array respeta el mismo orden de columnas
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        X = scaler.transform(X)
+    return model.predict(X)
+
+
+def ordenar_por_score(columnas, scores, columnar=False):
+    """
+    Ordena los técnicos por score descendente y arma la respuesta.
+
+    Args:
+        columnas: Diccionario {columna: np.ndarray}
+        scores: np.ndarray con el score de cada técnico
+        columnar: Si es True devuelve columnas ordenadas en lugar de registros
+
+    Returns:
+        Lista de diccionarios con técnicos ordenados por score (mejores primero),
+        o diccionario {columna: np.ndarray} si columnar=True
+    """
+    scores = np.asarray(scores)
+    orden = np.argsort(-scores, kind="stable")
+    ordenadas = {c: np.asarray(v)[orden] for c, v in columnas.items()}
+    ordenadas["score"] = scores[orden]
+    return ordenadas if columnar else registros(ordenadas)
+
+
+def puntuar_fallback(columnas):
+    """
+    Scorer de respaldo determinista, sin modelo. Combina con PESOS_FALLBACK:
+    cercanía (decae con la distancia), rating, servicios realizados
+    (escala logarítmica) y disponibilidad. Cada término queda en [0, 1].
+
+    Args:
+        columnas: Diccionario {columna: np.ndarray} con las FEATURES
+
+    Returns:
+        np.ndarray con un score por técnico
+    """
+    distancia = np.nan_to_num(
+        np.asarray(columnas["distancia_km"], dtype=np.float64), nan=np.inf, posinf=np.inf
+    )
+    cercania = np.exp(-np.maximum(distancia, 0) / ESCALA_DISTANCIA_KM)
+    rating = np.clip(np.nan_to_num(np.asarray(columnas["rating_promedio"], dtype=np.float64)), 0, 5) / 5
+    servicios = np.maximum(np.asarray(columnas["servicios_realizados"], dtype=np.float64), 0)
+    experiencia = np.minimum(np.log1p(servicios) / np.log1p(SERVICIOS_REFERENCIA), 1)
+    disponible = (np.asarray(columnas["disponibilidad"]) != 0).astype(np.float64)
+
+    return (
+        PESOS_FALLBACK["distancia"] * cercania
+        + PESOS_FALLBACK["rating"] * rating
+        + PESOS_FALLBACK["servicios"] * experiencia
+        + PESOS_FALLBACK["disponibilidad"] * disponible
+    )
+
+
+def registros(columnas):
+    """
+    Convierte un ranking columnar en la lista de diccionarios de la respuesta JSON.
+
+    Args:
+        columnas: Diccionario {columna: np.ndarray}
+
+    Returns:
+        Lista de diccionarios (una fila por técnico) con tipos nativos de Python
+    """
+    valores = [np.asarray(v).tolist() for v in columnas.values()]
+    return [dict(zip(columnas, fila)) for fila in zip(*valores)]
+
+
+def calentar_modelo(n_tecnicos=32):
+    """
+    Ejecuta una predicción sintética para que la primera petición real no
+    pague la inicialización del modelo (buffers de XGBoost, validaciones, etc.).
+
+    Args:
+        n_tecnicos: Cantidad de técnicos sintéticos a puntuar
+    """
+    cargar_modelo_recomendacion()
+    rng = np.random.default_rng(0)
+    payload = {
+        "solicitud": {"lat": -17.78, "lon": -63.18},
+        "tecnicos": {
+            "id_tecnico": np.arange(n_tecnicos),
+            "lat": -17.78 + rng.uniform(-0.1, 0.1, n_tecnicos),
+            "lon": -63.18 + rng.uniform(-0.1, 0.1, n_tecnicos),
+            "calificacion_promedio": rng.uniform(1, 5, n_tecnicos),
+            "disponibilidad": np.ones(n_tecnicos, dtype=bool),
+        },
+    }
+    columnas = columnas_desde_payload(payload)
+    ordenar_por_score(columnas, puntuar(columnas))
+
+
 # -----------------------------
 # FUNCIÓN PRINCIPAL
 # -----------------------------
-def recomendar_tecnicos(id_solicitud, payload=None):
+def recomendar_tecnicos(id_solicitud, payload=None, columnar=False, con_modelo=True):
     """
     Recomienda técnicos para una solicitud específica.
+    Con columnar=True devuelve un diccionario de columnas ordenadas (para los
+    formatos binarios) en lugar de la lista de diccionarios.
+    Si el modelo no está disponible (o con con_modelo=False) se usa el
+    scorer de respaldo (ver puntuar_fallback).
     
     MODO 1: Con payload (nuevo - desde Node.js con lat/lon)
         Args:
@@ -53,51 +302,34 @@ def recomendar_tecnicos(id_solicitud, payload=None):
     Returns:
         Lista de diccionarios con técnicos ordenados por score (mejores primero)
     """
-    # Cargar modelo si no está cargado
-    cargar_modelo_recomendacion()
-    
+    columnas = obtener_columnas(id_solicitud, payload)
+    if columnas is None:
+        return {} if columnar else []
+    resultado, _ = rankear(columnas, columnar=columnar, con_modelo=con_modelo)
+    return resultado
+
+
+def obtener_columnas(id_solicitud, payload=None):
+    """
+    Arma las features de todos los técnicos candidatos para una solicitud
+    (MODO 1 desde el payload, MODO 2 desde la BD; ver recomendar_tecnicos).
+
+    Returns:
+        Diccionario {columna: np.ndarray}, o None si no hay técnicos
+    """
     # MODO 1: Usar payload directo (desde Node.js)
     if payload and "solicitud" in payload and "tecnicos" in payload:
-        sol_data = payload["solicitud"]
-        tecnicos_data = payload["tecnicos"]
-        
-        cliente_lat = sol_data.get("lat", 0)
-        cliente_lon = sol_data.get("lon", 0)
-        
-        # Construir dataset temporal con datos del payload
-        rows = []
-        for t in tecnicos_data:
-            tecnico_lat = t.get("lat", 0)
-            tecnico_lon = t.get("lon", 0)
-            
-            distancia = haversine(cliente_lat, cliente_lon, tecnico_lat, tecnico_lon)
-            if distancia is None:
-                distancia = 0
-            
-            rating_historico = t.get("calificacion_promedio", 0) or 0
-            
-            row = {
-                "id_tecnico": t.get("id_tecnico", 0),
-                "nombre": t.get("nombre", "N/A"),
-                "apellido": t.get("apellido", ""),
-                "distancia_km": distancia,
-                "rating_promedio": t.get("calificacion_promedio", 0),
-                "historico_rating": rating_historico,
-                "cantidad_calificaciones": t.get("cantidad_calificaciones", 0) or 0,
-                "precio_promedio": t.get("precio_promedio", 0) or 0,
-                "ofertas_totales": t.get("ofertas_totales", 0) or 0,
-                "servicios_realizados": t.get("servicios_realizados", 0) or 0,
-                "disponibilidad": 1 if t.get("disponibilidad", False) else 0
-            }
-            rows.append(row)
-        
-        if not rows:
-            return []
+        columnas = columnas_desde_payload(payload)
         
-        df = pd.DataFrame(rows)
+        if len(columnas["id_tecnico"]) == 0:
+            return None
     
     # MODO 2: Buscar datos en BD (legacy)
     else:
+        # Import diferido: el modo payload no necesita pandas ni psycopg2
+        import pandas as pd
+        from db import query
+
         # 1) Obtener datos de la solicitud
         sql = f"""
             SELECT id_solicitud, id_cliente, id_categoria, lat AS cliente_lat, lon AS cliente_lon
@@ -107,7 +339,7 @@ def recomendar_tecnicos(id_solicitud, payload=None):
         sol = query(sql)
         
         if sol.empty:
-            return []
+            return None
 
         sol = sol.iloc[0]
         cliente_lat = sol["cliente_lat"]
@@ -124,7 +356,14 @@ def recomendar_tecnicos(id_solicitud, payload=None):
         tecnicos = query(sql_tec)
 
         if tecnicos.empty:
-            return []
+            return None
+
+        # Posiciones en vivo (POST /ubicaciones) tienen prioridad sobre tecnico_ubicacion
+        tecnicos["tecnico_lat"], tecnicos["tecnico_lon"] = almacen_ubicaciones.completar(
+            tecnicos["id_tecnico"].to_numpy(),
+            tecnicos["tecnico_lat"].to_numpy(dtype=float),
+            tecnicos["tecnico_lon"].to_numpy(dtype=float)
+        )
 
         # 3) Datos agregados (rating histórico, precios, etc.)
         sql_cal = """
@@ -147,13 +386,23 @@ def recomendar_tecnicos(id_solicitud, payload=None):
         pre = query(sql_pre)
         hist = query(sql_hist)
 
+        # Distancias en un solo paso; sin coordenadas (NaN) → DISTANCIA_DESCONOCIDA_KM
+        if cliente_lat is None or cliente_lon is None:
+            distancias = np.full(len(tecnicos), DISTANCIA_DESCONOCIDA_KM)
+        else:
+            distancias = haversine_vectorized(
+                float(cliente_lat), float(cliente_lon),
+                tecnicos["tecnico_lat"].to_numpy(dtype=np.float64),
+                tecnicos["tecnico_lon"].to_numpy(dtype=np.float64)
+            )
+            distancias = np.nan_to_num(distancias, nan=DISTANCIA_DESCONOCIDA_KM)
+
+        # NaN también es truthy: `calificacion_promedio or 0` no lo reemplazaba
+        ratings = pd.to_numeric(tecnicos["calificacion_promedio"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+
         # 4) Construir dataset temporal
         rows = []
-        for _, t in tecnicos.iterrows():
-            distancia = haversine(
-                cliente_lat, cliente_lon,
-                t["tecnico_lat"], t["tecnico_lon"]
-            )
+        for distancia, rating, (_, t) in zip(distancias, ratings, tecnicos.iterrows()):
 
             # Obtener datos agregados de forma segura (evitar IndexError)
             rating_historico = cal.loc[cal.id_tecnico == t.id_tecnico, "rating_promedio"].fillna(0).values
@@ -173,8 +422,8 @@ def recomendar_tecnicos(id_solicitud, payload=None):
 
             rows.append({
                 "id_tecnico": t.id_tecnico,
-                "distancia_km": distancia or 9999,
-                "rating_promedio": t.calificacion_promedio or 0,
+                "distancia_km": float(distancia),
+                "rating_promedio": float(rating),
                 "historico_rating": float(rating_historico),
                 "cantidad_calificaciones": int(cantidad_calif),
                 "precio_promedio": float(precio_prom),
@@ -184,32 +433,55 @@ def recomendar_tecnicos(id_solicitud, payload=None):
             })
 
         if not rows:
-            return []
+            return None
         
         df = pd.DataFrame(rows)
+        columnas = {col: df[col].to_numpy() for col in df.columns}
 
-    # 5) Features (común para ambos modos)
-    features = [
-        "distancia_km",
-        "rating_promedio",
-        "historico_rating",
-        "cantidad_calificaciones",
-        "precio_promedio",
-        "ofertas_totales",
-        "servicios_realizados",
-        "disponibilidad",
-    ]
-
-    # Verificar que todas las features existan
-    missing_features = [f for f in features if f not in df.columns]
+    # 5) Verificar que todas las features existan (común para ambos modos)
+    missing_features = [f for f in FEATURES if f not in columnas]
     if missing_features:
         raise ValueError(f"Features faltantes en el dataset: {missing_features}")
 
-    # 6) Escalar y predecir
-    X = scaler.transform(df[features])
-    df["score"] = model.predict(X)
+    return columnas
+
+
+def rankear(columnas, columnar=False, con_modelo=True, deadline=None):
+    """
+    Puntúa y ordena los técnicos con el modelo, o con el scorer de respaldo
+    si el modelo no está disponible, no se pide (con_modelo=False) o no
+    responde dentro del deadline.
+
+    Args:
+        columnas: Diccionario {columna: np.ndarray} con todas las FEATURES
+        columnar: Si es True devuelve columnas ordenadas en lugar de registros
+        con_modelo: Intentar usar el modelo
+        deadline: Instante límite (time.perf_counter()) para la predicción
+            del modelo (None = sin límite). Con deadline, si ya venció o hay
+            MODELO_HILOS predicciones en curso se usa el scorer de respaldo
+            sin esperar
+
+    Returns:
+        (resultado ordenado, "modelo" | "fallback")
+    """
+    scores = None
+    if con_modelo and modelo_disponible():
+        restante = None if deadline is None else deadline - time.perf_counter()
+        if restante is None:
+            scores = puntuar(columnas)
+        elif restante > 0 and _cupos_prediccion.acquire(blocking=False):
+            futuro = _ejecutor_prediccion.submit(puntuar, columnas)
+            # El cupo se libera cuando la predicción termina o se cancela
+            futuro.add_done_callback(lambda _: _cupos_prediccion.release())
+            try:
+                scores = futuro.result(timeout=restante)
+            except FuturesTimeoutError:
+                # Si aún no empezó se descarta; si ya corre, termina sin que la respuesta la espere
+                futuro.cancel()
+                scores = None
 
-    # 7) Ordenar DESC → mejores primero
-    df = df.sort_values(by="score", ascending=False)
+    if scores is None:
+        return ordenar_por_score(columnas, puntuar_fallback(columnas), columnar=columnar), "fallback"
 
-    return df.to_dict(orient="records")
+    # Ordenar DESC → mejores primero
+    return ordenar_por_score(columnas, scores, columnar=columnar), "modelo"
@@ -0,0 +1,252 @@
+"""
+Codificación y decodificación de los payloads de /recomendar.
+
+Si `orjson` está instalado se usa como códec JSON (parsea directo desde bytes
+y serializa tipos de NumPy sin conversiones intermedias). Si no está
+instalado, se usa el módulo `json` de la librería estándar con el mismo
+comportamiento.
+
+Además de JSON se aceptan dos formatos binarios columnares, negociados por
+`Content-Type` (petición) y `Accept` (respuesta):
+
+- MessagePack (`application/msgpack`, requiere `msgpack`): igual que el JSON
+  pero `tecnicos` es un diccionario de columnas. Cada columna puede ser una
+  lista, bytes crudos float64 little-endian, o `{"dtype": "<i8", "data": bytes}`.
+- Arrow IPC stream (`application/vnd.apache.arrow.stream`, requiere
+  `pyarrow`): una tabla con una fila por técnico; `id_solicitud` y
+  `solicitud` (JSON) viajan en los metadatos del esquema.
+
+Las columnas numéricas binarias se envuelven como arrays de NumPy sin copia.
+"""
+import importlib.util
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# pyarrow tarda en importarse: solo se verifica que exista y se importa al primer uso
+ARROW_DISPONIBLE = importlib.util.find_spec("pyarrow") is not None
+
+
+def _pyarrow():
+    import pyarrow
+    import pyarrow.ipc  # noqa: F401
+    return pyarrow
+
+ORJSON_DISPONIBLE = orjson is not None
+
+MIME_JSON = "application/json"
+MIME_MSGPACK = "application/msgpack"
+MIME_ARROW = "application/vnd.apache.arrow.stream"
+
+# Alias aceptados en Content-Type
+_ALIAS_MIME = {
+    "application/x-msgpack": MIME_MSGPACK,
+    "application/vnd.msgpack": MIME_MSGPACK,
+    "application/vnd.apache.arrow.file": MIME_ARROW,
+}
+
+
+def formatos_disponibles():
+    """Tipos MIME soportados con las librerías instaladas (JSON siempre)."""
+    formatos = [MIME_JSON]
+    if msgpack is not None:
+        formatos.append(MIME_MSGPACK)
+    if ARROW_DISPONIBLE:
+        formatos.append(MIME_ARROW)
+    return formatos
+
+
+def normalizar_mime(mime):
+    """
+    Normaliza un Content-Type a uno de los tipos MIME soportados.
+
+    Args:
+        mime: Tipo MIME sin parámetros (vacío → JSON)
+
+    Returns:
+        Tipo MIME canónico, o None si no está soportado/instalado
+    """
+    if not mime:
+        return MIME_JSON
+    mime = _ALIAS_MIME.get(mime, mime)
+    return mime if mime in formatos_disponibles() else None
+
+
+def _convertir_numpy(obj):
+    """Convierte arrays y escalares de NumPy a tipos nativos (fallback de json)."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no serializable a JSON")
+
+
+def decodificar_json(body):
+    """
+    Decodifica el cuerpo de una petición JSON.
+
+    Args:
+        body: Bytes del cuerpo de la petición
+
+    Returns:
+        Objeto Python decodificado, o None si el cuerpo está vacío
+
+    Raises:
+        ValueError: Si el cuerpo no es JSON válido
+    """
+    if not body:
+        return None
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def codificar_json(obj):
+    """
+    Codifica un objeto a JSON.
+
+    Args:
+        obj: Objeto a serializar (admite arrays y escalares de NumPy)
+
+    Returns:
+        Bytes UTF-8 con el JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_convertir_numpy, ensure_ascii=False).encode("utf-8")
+
+
+def _columna_desde_binario(valor):
+    """Envuelve una columna binaria de MessagePack como array de NumPy (sin copia)."""
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return np.frombuffer(valor, dtype="<f8")
+    if isinstance(valor, dict) and "data" in valor:
+        return np.frombuffer(valor["data"], dtype=np.dtype(valor.get("dtype", "<f8")))
+    return valor
+
+
+def _columna_a_binario(arr):
+    """Serializa una columna numérica como {dtype, data}; texto como lista."""
+    arr = np.asarray(arr)
+    if arr.dtype == object:
+        return arr.tolist()
+    arr = np.ascontiguousarray(arr)
+    return {"dtype": arr.dtype.str, "data": arr.tobytes()}
+
+
+def decodificar_msgpack(body):
+    """
+    Decodifica un payload MessagePack columnar.
+
+    Returns:
+        Payload con `tecnicos` como diccionario {columna: np.ndarray | lista}
+    """
+    if not body:
+        return None
+    data = msgpack.unpackb(body, raw=False)
+    tecnicos = data.get("tecnicos") if isinstance(data, dict) else None
+    if isinstance(tecnicos, dict):
+        data["tecnicos"] = {c: _columna_desde_binario(v) for c, v in tecnicos.items()}
+    return data
+
+
+def decodificar_arrow(body):
+    """
+    Decodifica un stream Arrow IPC con una fila por técnico.
+
+    Returns:
+        Payload con `tecnicos` como diccionario {columna: np.ndarray}
+    """
+    if not body:
+        return None
+    pa = _pyarrow()
+    with pa.ipc.open_stream(pa.py_buffer(body)) as lector:
+        tabla = lector.read_all()
+    meta = tabla.schema.metadata or {}
+    data = {
+        "id_solicitud": json.loads(meta.get(b"id_solicitud", b"null")),
+        "solicitud": json.loads(meta.get(b"solicitud", b"{}")),
+        "tecnicos": {},
+    }
+    for nombre, columna in zip(tabla.column_names, tabla.columns):
+        columna = columna.combine_chunks()
+        if pa.types.is_string(columna.type) or pa.types.is_large_string(columna.type):
+            data["tecnicos"][nombre] = columna.to_pylist()
+        else:
+            # Sin nulos la conversión es sin copia; con nulos se rellena con NaN
+            data["tecnicos"][nombre] = columna.to_numpy(zero_copy_only=False)
+    return data
+
+
+def decodificar(body, mime):
+    """
+    Decodifica el cuerpo de /recomendar según su tipo MIME.
+
+    Args:
+        body: Bytes del cuerpo de la petición
+        mime: Tipo MIME canónico (ver normalizar_mime)
+
+    Returns:
+        Payload decodificado, o None si el cuerpo está vacío
+
+    Raises:
+        ValueError: Si el cuerpo no es válido para el formato
+    """
+    try:
+        if mime == MIME_MSGPACK:
+            return decodificar_msgpack(body)
+        if mime == MIME_ARROW:
+            return decodificar_arrow(body)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Payload {mime} inválido: {e}")
+    return decodificar_json(body)
+
+
+def codificar_ranking(id_solicitud, columnas, mime, extras=None):
+    """
+    Codifica un ranking columnar en un formato binario.
+
+    Args:
+        id_solicitud: ID de la solicitud
+        columnas: Diccionario {columna: np.ndarray} ordenado por score
+        mime: MIME_MSGPACK o MIME_ARROW
+        extras: Campos adicionales de la respuesta JSON (scorer, degradado,
+            precalculado, pool_version): claves de primer nivel en
+            MessagePack y metadatos del esquema (en JSON) en Arrow
+
+    Returns:
+        Bytes con la respuesta
+    """
+    total = len(columnas.get("id_tecnico", ()))
+    extras = extras or {}
+    if mime == MIME_ARROW:
+        pa = _pyarrow()
+        tabla = pa.table(
+            {c: pa.array(v.tolist() if v.dtype == object else v) for c, v in columnas.items()},
+            metadata={
+                "id_solicitud": json.dumps(id_solicitud),
+                "total": json.dumps(total),
+                **{clave: json.dumps(valor) for clave, valor in extras.items()},
+            },
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+        return sink.getvalue().to_pybytes()
+
+    return msgpack.packb({
+        "id_solicitud": id_solicitud,
+        "tecnicos_recomendados": {c: _columna_a_binario(v) for c, v in columnas.items()},
+        "total": total,
+        **extras,
+    }, use_bin_type=True)
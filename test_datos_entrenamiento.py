@@ -0,0 +1,82 @@
+"""
+Pruebas de la preparación de grupos de ranking (datos_entrenamiento.py).
+
+Ejecutar con: python -m pytest -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from datos_entrenamiento import grupos_ranking, preparar_ranking
+
+FEATURES = ["distancia_km", "rating_promedio"]
+
+
+def dataset_desordenado(semilla=0, n=500):
+    """Filas de varias solicitudes mezcladas; cada fila lleva su id_solicitud codificado en las features."""
+    rng = np.random.default_rng(semilla)
+    ids = rng.integers(1, 40, n)
+    df = pd.DataFrame({
+        "id_solicitud": ids,
+        "id_tecnico": np.arange(n),
+        # Features y target derivados del id para verificar que las filas no se mezclan
+        "distancia_km": ids * 1000.0 + np.arange(n),
+        "rating_promedio": ids.astype(np.float64),
+        "target": ids % 2,
+    })
+    return df.sample(frac=1, random_state=semilla).reset_index(drop=True)
+
+
+def test_grupos_contiguos_y_tamanos_correctos():
+    df = dataset_desordenado()
+    ordenado, X, y, group, qid = preparar_ranking(df, FEATURES, "target")
+    ids = ordenado["id_solicitud"].to_numpy()
+
+    # Cada id_solicitud aparece en un solo bloque contiguo
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    assert len(inicios) == df["id_solicitud"].nunique()
+
+    esperado = df.groupby("id_solicitud", sort=True).size().to_numpy()
+    np.testing.assert_array_equal(group, esperado)
+    assert group.sum() == len(df)
+
+    assert len(qid) == len(df)
+    assert (np.diff(qid) >= 0).all()
+    np.testing.assert_array_equal(np.bincount(qid), group)
+
+
+def test_filas_alineadas_con_su_solicitud():
+    df = dataset_desordenado(semilla=1)
+    ordenado, X, y, group, qid = preparar_ranking(df, FEATURES, "target")
+    ids = ordenado["id_solicitud"].to_numpy()
+
+    assert X.flags.c_contiguous and y.flags.c_contiguous
+    np.testing.assert_array_equal(X[:, 1], ids)
+    np.testing.assert_array_equal(y, ids % 2)
+
+    # Cada fila conserva sus valores originales (por id_tecnico)
+    original = df.set_index("id_tecnico").loc[ordenado["id_tecnico"]]
+    np.testing.assert_array_equal(X[:, 0], original["distancia_km"].to_numpy())
+    np.testing.assert_array_equal(original["id_solicitud"].to_numpy(), ids)
+
+    # Un mismo qid corresponde siempre a un mismo id_solicitud
+    assert (pd.Series(ids).groupby(qid).nunique() == 1).all()
+
+
+def test_orden_estable_dentro_de_cada_solicitud():
+    df = dataset_desordenado(semilla=2)
+    ordenado, *_ = preparar_ranking(df, FEATURES, "target")
+    posicion_original = pd.Series(df.index, index=df["id_tecnico"])
+    for _, bloque in ordenado.groupby("id_solicitud"):
+        assert posicion_original[bloque["id_tecnico"]].is_monotonic_increasing
+
+
+def test_grupos_ranking_ids_ordenados():
+    group, qid = grupos_ranking([3, 3, 5, 7, 7, 7])
+    np.testing.assert_array_equal(group, [2, 1, 3])
+    np.testing.assert_array_equal(qid, [0, 0, 1, 2, 2, 2])
+
+
+def test_grupos_ranking_rechaza_ids_desordenados():
+    with pytest.raises(ValueError):
+        grupos_ranking([1, 2, 1])
@@ -3,35 +3,18 @@ Script alternativo para entrenar modelo de ranking.
 NOTA: Este script usa un esquema de features diferente a train_model.py.
 Se recomienda usar train_model.py que es el script principal.
 """
-import pandas as pd
-import numpy as np
 from xgboost import XGBRanker
 import joblib
-import os
 import sys
-from utils import haversine
+from datos_entrenamiento import cargar_dataset, completar_distancias, preparar_ranking
 
 def cargar_datos():
     """Carga y preprocesa el dataset"""
-    if not os.path.exists("dataset_tecnicos.csv"):
-        raise FileNotFoundError("dataset_tecnicos.csv no encontrado. Ejecuta build_dataset.py primero")
+    df = cargar_dataset("dataset_tecnicos.csv")
     
-    df = pd.read_csv("dataset_tecnicos.csv")
-    
-    if df.empty:
-        raise ValueError("El dataset está vacío")
-    
-    # Si el dataset ya tiene distancia_km, usarlo directamente
-    if "distancia_km" in df.columns:
+    # Usar distancia_km del dataset; las que falten se calculan desde las coordenadas
+    if completar_distancias(df, "distancia_km"):
         df["distancia"] = df["distancia_km"]
-    elif all(col in df.columns for col in ["lat_cliente", "lon_cliente", "lat_tecnico", "lon_tecnico"]):
-        # Calcular distancia si tenemos coordenadas
-        df["distancia"] = df.apply(lambda row:
-            haversine(
-                row["lat_cliente"], row["lon_cliente"],
-                row["lat_tecnico"], row["lon_tecnico"]
-            ), axis=1
-        )
     else:
         print("⚠ Advertencia: No se encontraron coordenadas para calcular distancia")
         df["distancia"] = 0
@@ -76,25 +59,20 @@ def entrenar_modelo():
         print(f"   Columnas disponibles: {list(df.columns)}")
         sys.exit(1)
     
-    X = df[features].values
-    
     # Buscar target
     if "contratado" in df.columns:
-        y = df["contratado"].values
+        target = "contratado"
     elif "target" in df.columns:
         print("⚠ Usando 'target' en lugar de 'contratado'")
-        y = df["target"].values
+        target = "target"
     else:
         print("❌ No se encontró columna 'contratado' ni 'target'")
         sys.exit(1)
 
-    if "id_solicitud" not in df.columns:
-        print("❌ Error: 'id_solicitud' no encontrado en el dataset")
-        sys.exit(1)
-
-    group = df.groupby("id_solicitud").size().tolist()
+    # Filas ordenadas por solicitud (orden estable) y grupos contiguos para XGBRanker
+    df, X, y, group, qid = preparar_ranking(df, features, target)
     
-    if not group:
+    if len(group) == 0:
         print("❌ No se pueden crear grupos para ranking")
         sys.exit(1)
 
@@ -110,7 +88,7 @@ def entrenar_modelo():
     )
 
     try:
-        ranker.fit(X, y, group=group)
+        ranker.fit(X, y, qid=qid)
         joblib.dump(ranker, "modelo_ranking.pkl")
         print("✅ Modelo entrenado y guardado como modelo_ranking.pkl")
     except Exception as e:
@@ -1,32 +1,25 @@
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import ndcg_score
 from sklearn.preprocessing import StandardScaler
 from xgboost import XGBRanker
 import joblib
-import os
 import sys
+from datos_entrenamiento import cargar_dataset, completar_distancias, ndcg_en_k, preparar_ranking
 
 # ------------------------------
 # 1. Verificar y cargar dataset
 # ------------------------------
-if not os.path.exists("dataset_tecnicos.csv"):
-    print("❌ Error: dataset_tecnicos.csv no encontrado")
-    print("   Ejecuta primero: python build_dataset.py")
+try:
+    df = cargar_dataset("dataset_tecnicos.csv")
+except (FileNotFoundError, ValueError) as e:
+    print(f"❌ Error: {e}")
     sys.exit(1)
 
-df = pd.read_csv("dataset_tecnicos.csv")
-
 print("📌 Dataset cargado:", df.shape)
 
-if df.empty:
-    print("❌ El dataset está vacío")
-    sys.exit(1)
-
 # ------------------------------
 # 2. Limpieza
 # ------------------------------
+# Distancias faltantes desde coordenadas (Haversine vectorizado) antes de rellenar con 0
+completar_distancias(df)
 df.fillna(0, inplace=True)
 
 # ------------------------------
@@ -50,8 +43,6 @@ if missing_features:
     print(f"   Columnas disponibles: {list(df.columns)}")
     sys.exit(1)
 
-X = df[features]
-
 # ------------------------------
 # 4. Definir TARGET (ranking)
 # ------------------------------
@@ -61,16 +52,12 @@ if "target" not in df.columns:
     print("   Se asignará dummy (todos 0). Debes reemplazar con datos reales después.")
     df["target"] = 0
 
-y = df["target"]
-
 # ------------------------------
 # 5. Agrupar por solicitud para ranking
 # ------------------------------
-if "id_solicitud" not in df.columns:
-    print("❌ Error: 'id_solicitud' no encontrado en el dataset")
-    sys.exit(1)
-
-groups = df.groupby("id_solicitud").size().to_list()
+# XGBRanker necesita las filas de cada solicitud contiguas: se ordena una vez
+# (orden estable) y qid/groups se derivan de ese orden
+df, _, y, groups, qid = preparar_ranking(df, features, "target")
 
 if len(groups) == 0:
     print("❌ Error: No se pueden crear grupos para ranking")
@@ -80,7 +67,8 @@ if len(groups) == 0:
 # 6. Escalado (MEJOR rendimiento)
 # ------------------------------
 scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+# Con el DataFrame el scaler guarda los nombres y el orden de las features
+X_scaled = scaler.fit_transform(df[features])
 
 # ------------------------------
 # 7. Entrenamiento del modelo
@@ -102,7 +90,7 @@ try:
     model.fit(
         X_scaled,
         y,
-        group=groups,
+        qid=qid,
     )
     print("✅ Modelo entrenado correctamente.")
 except Exception as e:
@@ -110,12 +98,15 @@ except Exception as e:
     sys.exit(1)
 
 # ------------------------------
-# 8. Evaluación (NDCG)
+# 8. Evaluación (NDCG@k por solicitud)
 # ------------------------------
+# peso_muestra (build_dataset) corrige el muestreo de negativos al estimar posiciones
+NDCG_K = 10
 try:
     predictions = model.predict(X_scaled)
-    ndcg = ndcg_score([y], predictions.reshape(1, -1))
-    print(f"📊 NDCG Score: {ndcg:.4f}")
+    pesos = df["peso_muestra"].to_numpy() if "peso_muestra" in df.columns else None
+    ndcg = ndcg_en_k(predictions, y, groups, k=NDCG_K, pesos=pesos)
+    print(f"📊 NDCG@{NDCG_K}: {ndcg:.4f}")
 except Exception as e:
     print(f"⚠ No se pudo calcular NDCG: {e}")
 
@@ -0,0 +1,170 @@
+"""
+Almacén en memoria de la última ubicación reportada por cada técnico.
+
+Las posiciones se guardan en arrays preasignados indexados directamente por
+`id_tecnico` (memoria acotada: `UBICACIONES_CAPACIDAD` técnicos). Los lotes
+de actualizaciones se aplican con asignación vectorizada, sin crear objetos
+por cada técnico, y solo se acepta una posición si es más reciente que la
+guardada.
+
+Las posiciones recientes tienen prioridad sobre las del pool y sobre
+`tecnico_ubicacion` al calcular distancias. Opcionalmente se vuelcan a
+PostgreSQL en segundo plano cada `UBICACIONES_FLUSH_SEG` segundos.
+"""
+import threading
+import time
+
+import numpy as np
+from decouple import config
+
+
+class AlmacenUbicaciones:
+    """Última posición por técnico en arrays preasignados (índice = id_tecnico)."""
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._lat = np.full(capacidad, np.nan)
+        self._lon = np.full(capacidad, np.nan)
+        self._ts = np.zeros(capacidad)
+        self._pendiente = np.zeros(capacidad, dtype=bool)
+        self._hilo_flush = None
+
+    def actualizar_lote(self, ids, lat, lon, ts=None):
+        """
+        Aplica un lote de posiciones.
+
+        Args:
+            ids: IDs de técnicos
+            lat: Latitudes
+            lon: Longitudes
+            ts: Timestamps (epoch en segundos); por defecto el momento actual
+
+        Returns:
+            (aceptadas, rechazadas). Se rechazan IDs fuera de capacidad,
+            coordenadas inválidas y posiciones más viejas que la guardada.
+
+        Raises:
+            ValueError: Si las columnas no tienen el mismo largo
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if ts is None:
+            ts = np.full(ids.shape, time.time())
+        else:
+            ts = np.asarray(ts, dtype=np.float64)
+        if ids.ndim != 1 or not (ids.shape == lat.shape == lon.shape == ts.shape):
+            raise ValueError("id_tecnico, lat, lon y ts deben ser listas del mismo largo")
+
+        validos = (
+            (ids >= 0) & (ids < self.capacidad)
+            & np.isfinite(lat) & np.isfinite(lon)
+            & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        )
+        ids, lat, lon, ts = ids[validos], lat[validos], lon[validos], ts[validos]
+
+        # Orden estable por timestamp: con IDs repetidos en el lote gana el último (más reciente)
+        orden = np.argsort(ts, kind="stable")
+        ids, lat, lon, ts = ids[orden], lat[orden], lon[orden], ts[orden]
+
+        with self._lock:
+            nuevos = ts >= self._ts[ids]
+            ids, lat, lon, ts = ids[nuevos], lat[nuevos], lon[nuevos], ts[nuevos]
+            self._lat[ids] = lat
+            self._lon[ids] = lon
+            self._ts[ids] = ts
+            self._pendiente[ids] = True
+
+        return len(ids), len(validos) - len(ids)
+
+    def posiciones(self, ids):
+        """
+        Posiciones conocidas para una lista de técnicos.
+
+        Args:
+            ids: IDs de técnicos
+
+        Returns:
+            (lat, lon) como arrays; NaN donde no hay posición reportada
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        dentro = (ids >= 0) & (ids < self.capacidad)
+        lat = np.full(len(ids), np.nan)
+        lon = np.full(len(ids), np.nan)
+        with self._lock:
+            lat[dentro] = self._lat[ids[dentro]]
+            lon[dentro] = self._lon[ids[dentro]]
+        return lat, lon
+
+    def completar(self, ids, lat, lon):
+        """
+        Reemplaza coordenadas por las reportadas en vivo cuando existen.
+
+        Args:
+            ids: IDs de técnicos
+            lat: Latitudes de respaldo (pool, payload o BD)
+            lon: Longitudes de respaldo
+
+        Returns:
+            (lat, lon) nuevos arrays con las posiciones más recientes
+        """
+        vivo_lat, vivo_lon = self.posiciones(ids)
+        conocida = ~np.isnan(vivo_lat)
+        lat = np.where(conocida, vivo_lat, np.asarray(lat, dtype=np.float64))
+        lon = np.where(conocida, vivo_lon, np.asarray(lon, dtype=np.float64))
+        return lat, lon
+
+    def extraer_pendientes(self):
+        """
+        Toma las posiciones modificadas desde el último volcado.
+
+        Returns:
+            (ids, lat, lon, ts) y limpia las marcas de pendiente
+        """
+        with self._lock:
+            ids = np.flatnonzero(self._pendiente)
+            self._pendiente[ids] = False
+            return ids, self._lat[ids], self._lon[ids], self._ts[ids]
+
+    def estado(self):
+        """Resumen del almacén para el endpoint GET /ubicaciones."""
+        with self._lock:
+            return {
+                "capacidad": self.capacidad,
+                "tecnicos_con_posicion": int(np.count_nonzero(self._ts)),
+                "pendientes_volcado": int(np.count_nonzero(self._pendiente)),
+                "volcado_activo": self._hilo_flush is not None,
+            }
+
+    def iniciar_volcado(self, intervalo, escribir):
+        """
+        Lanza un hilo que vuelca las posiciones pendientes cada `intervalo` segundos.
+
+        Args:
+            intervalo: Segundos entre volcados
+            escribir: Función (ids, lat, lon, ts) que persiste el lote
+        """
+        if self._hilo_flush is not None:
+            return
+
+        def ciclo():
+            while True:
+                time.sleep(intervalo)
+                ids, lat, lon, ts = self.extraer_pendientes()
+                if len(ids) == 0:
+                    continue
+                try:
+                    escribir(ids, lat, lon, ts)
+                except Exception as e:
+                    print(f"⚠ Error al volcar ubicaciones a la BD: {e}")
+                    # Volver a marcar para reintentar en el próximo ciclo
+                    with self._lock:
+                        self._pendiente[ids] = True
+
+        self._hilo_flush = threading.Thread(target=ciclo, name="volcado-ubicaciones", daemon=True)
+        self._hilo_flush.start()
+
+
+# Instancia global compartida por app.py y recommender.py
+almacen_ubicaciones = AlmacenUbicaciones(config("UBICACIONES_CAPACIDAD", default=100000, cast=int))